@@ -1,262 +1,549 @@
 import os
 import logging
-import traceback
+import time
+import zlib
+import random
+import threading
+from datetime import timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import httplib2
+import orjson
+import google_auth_httplib2
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest, set_user_agent
+from googleapiclient.model import JsonModel
 from google.oauth2 import service_account
 from google.auth import default
+from google.auth.credentials import with_scopes_if_required
 from google.auth.transport.requests import Request
-from kubernetes import client as k8s_client
+from utils.informer import get_node
+from utils.k8s_utils import list_nodes
+from utils.workloads import has_workload_pods_on_node, is_node_schedulable, is_node_drained
 
 logger = logging.getLogger("ip-address-controller")
 
+# Compute clients keyed by id(creds); building one parses the discovery document, so it happens once per process.
+_SERVICE_CACHE = {}
+_service_lock = threading.Lock()
+# httplib2 transports are not thread-safe, so only they are per thread: one kept-alive TLS
+# session per worker thread, and fan-out GETs go through fetch_instances_batch as one multipart request.
+_http_local = threading.local()
+
+# Application Default Credentials resolved once per process; all loading and refreshing is under _creds_lock
+_CREDS_CACHE = None
+_creds_lock = threading.Lock()
+# id(creds) -> (creds, epoch seconds after which its token is refreshed); the fast path is one float compare.
+# The creds are kept so a new object that reuses a collected one's id is not mistaken for it.
+_refresh_at = {}
+# Token refreshes run under _creds_lock, so one pooled requests.Session serves them all
+_auth_request = Request()
+
+# Compute batch endpoint accepts at most this many calls per request.
+BATCH_MAX_REQUESTS = 1000
+GCP_HTTP_TIMEOUT = int(os.getenv("GCP_HTTP_TIMEOUT", "30"))
+CLOUD_PLATFORM_SCOPE = "https://www.googleapis.com/auth/cloud-platform"
+# What attach/detach need to address an access config: NIC name plus each config's name, type and IP
+NIC_FIELDS = "networkInterfaces(name,accessConfigs(name,type,natIP))"
+# Partial response for IP checks and the instance cache. It carries the NIC and access-config
+# names too, a few bytes per node, so a detach can act on the view the reconcile just fetched.
+NAT_IP_FIELDS = NIC_FIELDS
+# Google APIs only gzip responses for clients whose User-Agent contains "gzip"
+USER_AGENT = "ip-address-controller (gzip)"
+# GKE nodes have a single NIC with this name
+DEFAULT_NIC_NAME = "nic0"
+OPERATION_TIMEOUT = int(os.getenv("GCP_OPERATION_TIMEOUT", "120"))
+# NAT-IP views of instances are reused for this many seconds across overlapping reconciles
+INSTANCE_CACHE_TTL = float(os.getenv("GCP_INSTANCE_CACHE_TTL", "5"))
+# Past this many entries, expired ones are dropped on store so deleted nodes don't accumulate
+INSTANCE_CACHE_MAX = 4096
+# A zone with at least this many uncached nodes is read with one paged instances.list, not per-node GETs
+ZONE_LIST_MIN_NODES = int(os.getenv("GCP_ZONE_LIST_MIN_NODES", "20"))
+# Zone lists run concurrently, capped low so a large pool stays inside the read-request quota
+ZONE_FETCH_WORKERS = int(os.getenv("GCP_ZONE_FETCH_WORKERS", "5"))
+_zone_executor = ThreadPoolExecutor(max_workers=ZONE_FETCH_WORKERS, thread_name_prefix="gcp-zone")
+# (project, zone, instance) -> (fetched_at_monotonic, instance); writes go through invalidate_instance
+_instance_cache = {}
+_instance_cache_lock = threading.Lock()
+# (project, zone, instance) -> Event set once the thread fetching that instance has stored it, so
+# concurrent reconciles of pools sharing nodes wait for one fetch instead of issuing their own
+_instance_inflight = {}
+# Tokens are refreshed this long before they expire, once, instead of by whichever worker hits expiry
+CREDS_REFRESH_MARGIN = timedelta(minutes=5)
+
+
+class _OrjsonModel(JsonModel):
+    """JsonModel that parses Compute responses with orjson instead of the stdlib json module."""
+
+    def deserialize(self, content):
+        try:
+            body = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return content.decode("utf-8") if isinstance(content, bytes) else content
+        if self._data_wrapper and isinstance(body, dict) and "data" in body:
+            body = body["data"]
+        return body
+
+
+def _thread_http(creds):
+    """Return this thread's authorized transport for these credentials, creating it once."""
+    cache = getattr(_http_local, "transports", None)
+    if cache is None:
+        cache = _http_local.transports = {}
+
+    key = id(creds)
+    entry = cache.get(key)
+    if entry is None or entry[0] is not creds:
+        http = google_auth_httplib2.AuthorizedHttp(
+            with_scopes_if_required(creds, [CLOUD_PLATFORM_SCOPE]),
+            http=httplib2.Http(timeout=GCP_HTTP_TIMEOUT),
+        )
+        # httplib2 already sends Accept-Encoding: gzip; the marker tells the backend to honour it
+        entry = (creds, set_user_agent(http, USER_AGENT))
+        cache[key] = entry
+    return entry[1]
+
 
 def build_compute_service(creds):
-    """Create the Compute Engine API client."""
-    return build("compute", "v1", credentials=creds)
+    """Return the Compute Engine API client for these credentials, building it once.
+
+    The client is shared by all threads; each request it builds is bound to the calling thread's transport.
+    """
+    key = id(creds)
+    entry = _SERVICE_CACHE.get(key)
+    if entry is not None and entry[0] is creds:
+        return entry[1]
+
+    with _service_lock:
+        entry = _SERVICE_CACHE.get(key)
+        if entry is None or entry[0] is not creds:
+            def _request(http, *args, **kwargs):
+                # Batches and list_next reuse request.http, so they stay on this thread's transport too
+                return HttpRequest(_thread_http(creds), *args, **kwargs)
+
+            service = build(
+                "compute", "v1", http=_thread_http(creds), requestBuilder=_request,
+                model=_OrjsonModel(), static_discovery=True, cache_discovery=False,
+            )
+            entry = (creds, service)
+            _SERVICE_CACHE[key] = entry
+        return entry[1]
 
 
-def get_gcp_credentials():
-    """Detect GCP credentials (JSON key, Workload Identity, or node default)."""
-    if hasattr(get_gcp_credentials, "cached"):
-        return get_gcp_credentials.cached
+@lru_cache(maxsize=1)
+def _load_sa_creds(path, mtime_ns):
+    """Parse a service account key file; mtime_ns is part of the key so a rotated file is reloaded."""
+    # Scoped here so _thread_http uses (and refreshes) this object rather than a scoped copy
+    return service_account.Credentials.from_service_account_file(path, scopes=[CLOUD_PLATFORM_SCOPE])
 
-    try:
-        if os.environ.get("GOOGLE_APPLICATION_CREDENTIALS"):
-            creds = service_account.Credentials.from_service_account_file(
-                os.environ["GOOGLE_APPLICATION_CREDENTIALS"]
-            )
-            project = creds.project_id
-        else:
-            creds, project = default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
-            if getattr(creds, "expired", False) and getattr(creds, "refresh_token", None):
-                creds.refresh(Request())
 
-        get_gcp_credentials.cached = (creds, project)
-        return creds, project
-    except Exception:
-        tb = traceback.format_exc()
-        logger.error("Failed to get GCP credentials", extra={"trace": tb})
-        raise
+def _refresh_locked(creds):
+    """Refresh the token and record when to refresh it next. Caller holds _creds_lock."""
+    creds.refresh(_auth_request)
+    expiry = getattr(creds, "expiry", None)
+    if expiry is None:
+        deadline = float("inf")
+    else:
+        deadline = (expiry.replace(tzinfo=timezone.utc) - CREDS_REFRESH_MARGIN).timestamp()
+    # Credentials are replaced on key rotation; keep only the current one's deadline
+    _refresh_at.clear()
+    _refresh_at[id(creds)] = (creds, deadline)
 
 
-def node_has_ip(node, ip, creds=None, project=None, crd_name=""):
-    """Return True if this node already has the specific external IP."""
-    try:
-        if creds is None or project is None:
-            creds, project = get_gcp_credentials()
+def _refresh_deadline(creds):
+    entry = _refresh_at.get(id(creds))
+    if entry is None or entry[0] is not creds:
+        return 0.0
+    return entry[1]
+
+
+def _refresh_if_expiring(creds):
+    """Refresh the token if it is missing or expires within CREDS_REFRESH_MARGIN."""
+    if time.time() < _refresh_deadline(creds):
+        return
+    with _creds_lock:
+        if time.time() >= _refresh_deadline(creds):
+            _refresh_locked(creds)
 
-        zone = node.metadata.labels.get("topology.kubernetes.io/zone", "")
-        instance_name = node.metadata.name
-        service = build_compute_service(creds)
 
+def get_gcp_credentials():
+    """Detect GCP credentials (JSON key, Workload Identity, or node default)."""
+    global _CREDS_CACHE
+    key_path = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
+    if key_path:
+        try:
+            mtime_ns = os.stat(key_path).st_mtime_ns
+            with _creds_lock:
+                # Serialized so concurrent first calls parse the key file once
+                creds = _load_sa_creds(key_path, mtime_ns)
+            _refresh_if_expiring(creds)
+        except Exception:
+            logger.exception("Failed to get GCP credentials")
+            raise
+        return creds, creds.project_id
+
+    cached = _CREDS_CACHE
+    if cached is not None:
+        try:
+            _refresh_if_expiring(cached[0])
+        except Exception:
+            logger.exception("Failed to refresh GCP credentials")
+            raise
+        return cached
+
+    with _creds_lock:
+        if _CREDS_CACHE is not None:
+            return _CREDS_CACHE
+        try:
+            creds, project = default(scopes=[CLOUD_PLATFORM_SCOPE])
+            _refresh_locked(creds)
+
+            _CREDS_CACHE = (creds, project)
+            return _CREDS_CACHE
+        except Exception:
+            logger.exception("Failed to get GCP credentials")
+            raise
+
+
+def _nat_ips(instance):
+    """Return the set of external NAT IPs configured on an instance."""
+    return {
+        ac.get("natIP")
+        for iface in instance.get("networkInterfaces", ())
+        for ac in iface.get("accessConfigs", ())
+    }
+
+
+def _access_configs(instance):
+    """Yield every access config on every NIC of an instance."""
+    for iface in instance.get("networkInterfaces", ()):
+        yield from iface.get("accessConfigs", ())
+
+
+def _node_zone(node):
+    return (node.metadata.labels or {}).get("topology.kubernetes.io/zone", "")
+
+
+def _instance_key(project, node):
+    return project, _node_zone(node), node.metadata.name
+
+
+def _cached_instance(key):
+    with _instance_cache_lock:
+        entry = _instance_cache.get(key)
+    if entry is not None and time.monotonic() - entry[0] < INSTANCE_CACHE_TTL:
+        return entry[1]
+    return None
+
+
+def _store_instance(key, instance):
+    now = time.monotonic()
+    with _instance_cache_lock:
+        if len(_instance_cache) >= INSTANCE_CACHE_MAX:
+            for stale in [k for k, entry in _instance_cache.items() if now - entry[0] >= INSTANCE_CACHE_TTL]:
+                del _instance_cache[stale]
+        _instance_cache[key] = (now, instance)
+
+
+def _claim_instances(project, nodes):
+    """Split nodes into cached instances, nodes this caller must fetch, and fetches already in flight."""
+    cached, claimed, waiting = {}, [], []
+    now = time.monotonic()
+    with _instance_cache_lock:
+        for node in nodes:
+            key = _instance_key(project, node)
+            entry = _instance_cache.get(key)
+            if entry is not None and now - entry[0] < INSTANCE_CACHE_TTL:
+                cached[node.metadata.name] = entry[1]
+            elif key in _instance_inflight:
+                waiting.append((key, _instance_inflight[key]))
+            else:
+                _instance_inflight[key] = threading.Event()
+                claimed.append(node)
+    return cached, claimed, waiting
+
+
+def _release_instances(project, nodes):
+    with _instance_cache_lock:
+        for node in nodes:
+            done = _instance_inflight.pop(_instance_key(project, node), None)
+            if done is not None:
+                done.set()
+
+
+def invalidate_instance(project, zone, instance_name):
+    """Drop the cached view of an instance after changing its access configs."""
+    with _instance_cache_lock:
+        _instance_cache.pop((project, zone, instance_name), None)
+
+
+def _get_instance(node, creds, project):
+    """Return the node's instance view, sharing the cache and in-flight fetches with node_ips_bulk."""
+    if creds is None or project is None:
+        creds, project = get_gcp_credentials()
+    key = _instance_key(project, node)
+    cached, claimed, waiting = _claim_instances(project, [node])
+    if cached:
+        return cached[node.metadata.name]
+    if waiting:
+        waiting[0][1].wait(GCP_HTTP_TIMEOUT)
+        instance = _cached_instance(key)
+        if instance is not None:
+            return instance
+        # The other fetch failed; fetch unclaimed rather than fail this caller too
+    try:
+        service = build_compute_service(creds)
         instance = service.instances().get(
-            project=project, zone=zone, instance=instance_name
+            project=project, zone=key[1], instance=key[2], fields=NAT_IP_FIELDS
         ).execute()
+        _store_instance(key, instance)
+    finally:
+        _release_instances(project, claimed)
+    return instance
 
-        for iface in instance.get("networkInterfaces", []):
-            for ac in iface.get("accessConfigs", []):
-                if ac.get("natIP") == ip:
-                    return True
-        return False
-    except HttpError:
-        tb = traceback.format_exc()
-        logger.error(
-            "GCP API error checking IP",
-            extra={"crd_name": crd_name, "node": node.metadata.name, "ip": ip, "zone": zone, "trace": tb},
+
+def node_has_ip(node, ip, creds=None, project=None, crd_name="", instance=None):
+    """Return True if this node already has the specific external IP; pass instance to skip the fetch."""
+    zone = _node_zone(node)
+    try:
+        if instance is None:
+            instance = _get_instance(node, creds, project)
+        return any(ac.get("natIP") == ip for ac in _access_configs(instance))
+    except HttpError as e:
+        # Expected failure mode (quota, 404 for a deleted VM); the traceback adds nothing above DEBUG
+        logger.warning(
+            f"GCP API error checking IP: HTTP {e.resp.status}",
+            extra={"crd_name": crd_name, "node": node.metadata.name, "ip": ip, "zone": zone},
+            exc_info=logger.isEnabledFor(logging.DEBUG),
         )
         return False
     except Exception:
-        tb = traceback.format_exc()
-        logger.error(
+        logger.exception(
             "Unexpected error in node_has_ip",
-            extra={"crd_name": crd_name, "node": node.metadata.name, "ip": ip, "zone": zone, "trace": tb},
+            extra={"crd_name": crd_name, "node": node.metadata.name, "ip": ip, "zone": zone},
         )
         return False
 
 
-def node_has_any_reserved_ip(node, reserved_ips, creds=None, project=None, crd_name=""):
-    """Return True if the node already has any IP from the reserved pool."""
+def fetch_instances_batch(service, project, nodes, fields=NAT_IP_FIELDS, crd_name=""):
+    """Return {node_name: instance} for all nodes, fetched in batch requests; failed lookups are left out."""
+    instances = {}
+
+    def _collect(request_id, response, exception):
+        if exception is not None:
+            logger.error(
+                "GCP API error fetching instance",
+                extra={"crd_name": crd_name, "node": request_id, "trace": str(exception)},
+            )
+            return
+        instances[request_id] = response
+
+    for start in range(0, len(nodes), BATCH_MAX_REQUESTS):
+        batch = service.new_batch_http_request(callback=_collect)
+        for node in nodes[start:start + BATCH_MAX_REQUESTS]:
+            batch.add(
+                service.instances().get(
+                    project=project, zone=_node_zone(node), instance=node.metadata.name, fields=fields
+                ),
+                request_id=node.metadata.name,
+            )
+        try:
+            batch.execute()
+        except Exception:
+            # Keep the other batches; this one's nodes are left out like individual failures
+            logger.exception("GCP batch instance fetch failed", extra={"crd_name": crd_name})
+    return instances
+
+
+def list_zone_instances(service, project, zone, names, fields=NAT_IP_FIELDS):
+    """Return {name: instance} for the named instances in a zone, read with paged instances.list calls."""
+    wanted = set(names)
+    instances = {}
+    request = service.instances().list(
+        project=project, zone=zone, maxResults=500, fields=f"items(name,{fields}),nextPageToken"
+    )
+    while request is not None:
+        response = request.execute()
+        for instance in response.get("items", ()):
+            if instance.get("name") in wanted:
+                instances[instance["name"]] = instance
+        request = service.instances().list_next(request, response)
+    return instances
+
+
+def _list_zone_instances_for(creds, project, zone, names):
+    return list_zone_instances(build_compute_service(creds), project, zone, names)
+
+
+def node_ips_bulk(nodes, creds=None, project=None, crd_name=""):
+    """Return {node_name: set of NAT IPs} for the nodes whose instances could be read.
+
+    Nodes whose lookup failed are left out rather than reported IP-less, so callers can tell
+    "no IP" from "unknown". Uncached instances are fetched with one instances.list per busy zone
+    and batched GETs for the rest; instances another thread is already fetching are waited for.
+    """
+    if not nodes:
+        return {}
+
     try:
         if creds is None or project is None:
             creds, project = get_gcp_credentials()
+    except Exception:
+        logger.exception("Failed to get GCP credentials for node_ips_bulk", extra={"crd_name": crd_name})
+        return {}
 
-        zone = node.metadata.labels.get("topology.kubernetes.io/zone", "")
-        instance_name = node.metadata.name
-        service = build_compute_service(creds)
-
-        instance = service.instances().get(
-            project=project, zone=zone, instance=instance_name
+    instances, missing, waiting = _claim_instances(project, nodes)
+    try:
+        if missing:
+            service = build_compute_service(creds)
+            by_zone = {}
+            for node in missing:
+                by_zone.setdefault(_node_zone(node), []).append(node)
+            small = []
+            zone_lists = []
+            for zone, zone_nodes in by_zone.items():
+                if len(zone_nodes) >= ZONE_LIST_MIN_NODES:
+                    # Zone lists run in parallel, each on a pool thread with its own transport
+                    zone_lists.append((zone, _zone_executor.submit(
+                        _list_zone_instances_for, creds, project, zone, [n.metadata.name for n in zone_nodes]
+                    )))
+                else:
+                    small.extend(zone_nodes)
+            fetched = {}
+            if small:
+                fetched.update(fetch_instances_batch(service, project, small, crd_name=crd_name))
+            for zone, future in zone_lists:
+                try:
+                    fetched.update(future.result())
+                except Exception:
+                    # Only this zone's nodes become unknown; the other zones' results are kept
+                    logger.exception("GCP zone instance list failed", extra={"crd_name": crd_name, "zone": zone})
+            for node in missing:
+                if node.metadata.name in fetched:
+                    _store_instance(_instance_key(project, node), fetched[node.metadata.name])
+            instances.update(fetched)
+    except Exception:
+        logger.exception("Unexpected error in node_ips_bulk", extra={"crd_name": crd_name})
+    finally:
+        _release_instances(project, missing)
+    # Instances another reconcile was already fetching; a failed fetch leaves them out, as batch errors do
+    for key, done in waiting:
+        done.wait(GCP_HTTP_TIMEOUT)
+        instance = _cached_instance(key)
+        if instance is not None:
+            instances[key[2]] = instance
+
+    return {node_name: _nat_ips(instance) for node_name, instance in instances.items()}
+
+
+def wait_for_zone_operation(service, project, zone, operation, timeout=OPERATION_TIMEOUT):
+    """Block until a zonal Compute operation is DONE; raise if it failed or timed out."""
+    deadline = time.monotonic() + timeout
+    while operation.get("status") != "DONE":
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Compute operation {operation.get('name')} did not finish in {timeout}s")
+        # zoneOperations.wait long-polls server-side instead of sleeping client-side
+        operation = service.zoneOperations().wait(
+            project=project, zone=zone, operation=operation["name"]
         ).execute()
 
-        reserved_set = set(reserved_ips or [])
-        for iface in instance.get("networkInterfaces", []):
-            for ac in iface.get("accessConfigs", []):
-                if ac.get("natIP") in reserved_set:
-                    return True
-        return False
-    except Exception:
-        tb = traceback.format_exc()
-        logger.error(
-            "Error checking any reserved IP on node",
-            extra={
-                "crd_name": crd_name,
-                "node": node.metadata.name,
-                "zone": node.metadata.labels.get("topology.kubernetes.io/zone", ""),
-                "trace": tb,
-            },
-        )
-        return False
+    if operation.get("error"):
+        raise RuntimeError(f"Compute operation {operation.get('name')} failed: {operation['error']}")
+    return operation
+
 
+def attach_ip_to_node(ip, node, creds=None, project=None, crd_name="", iface_name=DEFAULT_NIC_NAME, wait=False):
+    """Attach a static external IP to a GKE node (a V1Node; replace existing NAT if present).
 
-def attach_ip_to_node(ip, node_name, creds=None, project=None, crd_name=""):
-    """Attach a static external IP to a GKE node (replace existing NAT if present)."""
+    Returns the addAccessConfig operation; with wait=True, returns only once it is DONE.
+    """
+    node_name = node.metadata.name
+    zone = _node_zone(node)
     try:
         if creds is None or project is None:
             creds, project = get_gcp_credentials()
 
-        v1 = k8s_client.CoreV1Api()
-        node = v1.read_node(node_name)
-        zone = node.metadata.labels.get("topology.kubernetes.io/zone", "")
         service = build_compute_service(creds)
-
-        instance = service.instances().get(
-            project=project, zone=zone, instance=node_name
-        ).execute()
-        iface = instance["networkInterfaces"][0]
-        iface_name = iface["name"]
-        access_configs = iface.get("accessConfigs", [])
-
-        for ac in access_configs:
-            if ac.get("type") == "ONE_TO_ONE_NAT":
-                service.instances().deleteAccessConfig(
-                    project=project,
-                    zone=zone,
-                    instance=node_name,
-                    networkInterface=iface_name,
-                    accessConfig=ac["name"],
-                ).execute()
-                break
-
         body = {"name": "external-nat", "type": "ONE_TO_ONE_NAT", "natIP": ip}
-        service.instances().addAccessConfig(
-            project=project,
-            zone=zone,
-            instance=node_name,
-            networkInterface=iface_name,
-            body=body,
-        ).execute()
 
+        try:
+            # Fast path: the NIC has no NAT yet, so one call is enough
+            add_op = service.instances().addAccessConfig(
+                project=project,
+                zone=zone,
+                instance=node_name,
+                networkInterface=iface_name,
+                body=body,
+            ).execute()
+        except HttpError as e:
+            if e.resp.status not in (400, 409):
+                raise
+            # An access config already exists (or the NIC name differs): replace it
+            instance = service.instances().get(
+                project=project, zone=zone, instance=node_name, fields=NIC_FIELDS
+            ).execute()
+            iface = instance["networkInterfaces"][0]
+            iface_name = iface["name"]
+            access_configs = iface.get("accessConfigs", ())
+
+            for ac in access_configs:
+                if ac.get("type") == "ONE_TO_ONE_NAT":
+                    delete_op = service.instances().deleteAccessConfig(
+                        project=project,
+                        zone=zone,
+                        instance=node_name,
+                        networkInterface=iface_name,
+                        accessConfig=ac["name"],
+                    ).execute()
+                    # The NIC holds one NAT config; the add is rejected until the delete lands
+                    wait_for_zone_operation(service, project, zone, delete_op)
+                    break
+
+            add_op = service.instances().addAccessConfig(
+                project=project,
+                zone=zone,
+                instance=node_name,
+                networkInterface=iface_name,
+                body=body,
+            ).execute()
+
+        if wait:
+            wait_for_zone_operation(service, project, zone, add_op)
+        invalidate_instance(project, zone, node_name)
         logger.info(
             "Attached static external IP successfully",
             extra={"crd_name": crd_name, "node": node_name, "ip": ip, "zone": zone},
         )
+        return add_op
 
-    except HttpError:
-        tb = traceback.format_exc()
+    except HttpError as e:
+        # Re-raised to the reconciler, which logs the traceback once
         logger.error(
-            "GCP API error attaching IP",
-            extra={"crd_name": crd_name, "node": node_name, "ip": ip, "zone": zone, "trace": tb},
+            f"GCP API error attaching IP: HTTP {e.resp.status}",
+            extra={"crd_name": crd_name, "node": node_name, "ip": ip, "zone": zone},
         )
         raise
     except Exception:
-        tb = traceback.format_exc()
-        logger.error(
+        logger.exception(
             "Unexpected error in attach_ip_to_node",
-            extra={"crd_name": crd_name, "node": node_name, "ip": ip, "zone": zone, "trace": tb},
+            extra={"crd_name": crd_name, "node": node_name, "ip": ip, "zone": zone},
         )
         raise
 
 
-def is_node_cordoned(node):
-    """Check if node is cordoned (unschedulable)."""
-    return getattr(node.spec, 'unschedulable', False) or False
-
-
-def _is_owned_by_workload(owner, workload_kind, workload_name):
-    """Check if owner reference matches the workload."""
-    if workload_kind == "Deployment":
-        return owner.kind == "ReplicaSet" and workload_name in owner.name
-    elif workload_kind == "StatefulSet":
-        return owner.kind == "StatefulSet" and owner.name == workload_name
-    elif workload_kind == "DaemonSet":
-        return owner.kind == "DaemonSet" and owner.name == workload_name
-    return False
-
-
-def has_workload_pods_on_node(node_name, workload_ref, v1_client, logger):
-    """Check if the referenced workload has pods running on this node."""
-    if not workload_ref:
-        return False
-
-    workload_kind = workload_ref.get("kind")
-    workload_name = workload_ref.get("name")
-    workload_namespace = workload_ref.get("namespace", "default")
-
-    if not workload_kind or not workload_name:
-        return False
-    try:
-        pods = v1_client.list_namespaced_pod(
-            namespace=workload_namespace,
-            field_selector=f"spec.nodeName={node_name}",
-        )
-
-        for pod in pods.items:
-            if pod.status.phase not in ("Running", "Pending"):
-                continue
-            if pod.metadata.deletion_timestamp:
-                continue
-            owner_refs = pod.metadata.owner_references or []
-            pod_labels = pod.metadata.labels or {}
-            for owner in owner_refs:
-                if _is_owned_by_workload(owner, workload_kind, workload_name):
-                    logger.info(
-                        f"Found running pod {pod.metadata.name} from {workload_kind} {workload_name} on node {node_name}",
-                        extra={
-                            "node": node_name,
-                            "pod": pod.metadata.name,
-                            "workload_kind": workload_kind,
-                            "workload_name": workload_name,
-                        },
-                    )
-                    return True
-
-            # Fallback: check labels
-            if pod_labels.get("app") == workload_name or pod_labels.get("app.kubernetes.io/name") == workload_name:
-                logger.info(
-                    f"Found running pod {pod.metadata.name} (label match) from {workload_kind} {workload_name} on node {node_name}",
-                    extra={
-                        "node": node_name,
-                        "pod": pod.metadata.name,
-                        "workload_kind": workload_kind,
-                        "workload_name": workload_name,
-                    },
-                )
-                return True
-
-        return False
-    except Exception:
-        tb = traceback.format_exc()
-        logger.error(
-            "Error checking workload pods on node",
-            extra={
-                "node": node_name,
-                "workload_kind": workload_kind,
-                "workload_name": workload_name,
-                "namespace": workload_namespace,
-                "trace": tb,
-            },
-        )
-        return True
-
+def detach_ip_from_node(ip, node_name, v1_client, creds=None, project=None, crd_name="", controller_label="app", workload_ref=None, node_selector=None, node=None, reattach=True):
+    """Detach the specific static external IP from a drained or cordoned node and re-attach to healthy node.
 
-def detach_ip_from_node(ip, node_name, v1_client, creds=None, project=None, crd_name="", controller_label="app", workload_ref=None, node_selector=None):
-    """Detach the specific static external IP from a drained or cordoned node and re-attach to healthy node."""
-    from utils.reconciler import is_node_drained
-    node = v1_client.read_node(node_name)
-    zone = node.metadata.labels.get("topology.kubernetes.io/zone", "")
+    Pass the V1Node as node when the caller already has it to skip the lookup. With reattach=False the
+    IP is only detached (and the delete waited on), leaving its placement to the caller.
+    Returns False if the node still needs the IP and it was left in place, True once it is off the node.
+    """
+    if node is None:
+        node = get_node(v1_client, node_name)
+    zone = _node_zone(node)
 
-    node_cordoned = is_node_cordoned(node)
+    node_cordoned = not is_node_schedulable(node)
     node_drained = is_node_drained(node, v1_client, controller_label=controller_label, logger=logger, workload_ref=workload_ref)
 
     if not node_cordoned and not node_drained:
@@ -264,7 +551,7 @@ def detach_ip_from_node(ip, node_name, v1_client, creds=None, project=None, crd_
             f"Node {node_name} is not cordoned or drained; skipping IP detach",
             extra={"crd_name": crd_name, "node": node_name, "ip": ip, "zone": zone},
         )
-        return
+        return False
 
     if node_cordoned and not node_drained:
         if has_workload_pods_on_node(node_name, workload_ref, v1_client, logger):
@@ -279,7 +566,7 @@ def detach_ip_from_node(ip, node_name, v1_client, creds=None, project=None, crd_
                     "workload_name": workload_ref.get("name") if workload_ref else None,
                 },
             )
-            return
+            return False
 
     logger.info(
         f"Node {node_name} is ready for IP detach (cordoned={node_cordoned}, drained={node_drained})",
@@ -290,38 +577,47 @@ def detach_ip_from_node(ip, node_name, v1_client, creds=None, project=None, crd_
         if creds is None or project is None:
             creds, project = get_gcp_credentials()
         service = build_compute_service(creds)
-        instance = service.instances().get(
-            project=project, zone=zone, instance=node_name
-        ).execute()
+        # Usually still cached from this reconcile's node_ips_bulk; a stale view fails the delete and is dropped below
+        instance = _cached_instance((project, zone, node_name))
+        if instance is None:
+            instance = service.instances().get(
+                project=project, zone=zone, instance=node_name, fields=NIC_FIELDS
+            ).execute()
         iface = instance["networkInterfaces"][0]
-        access_configs = iface.get("accessConfigs", [])
+        access_configs = iface.get("accessConfigs", ())
 
-        ip_detached = False
+        delete_op = None
         for ac in access_configs:
             if ac.get("natIP") == ip:
-                service.instances().deleteAccessConfig(
+                delete_op = service.instances().deleteAccessConfig(
                     project=project,
                     zone=zone,
                     instance=node_name,
                     networkInterface=iface["name"],
                     accessConfig=ac["name"],
                 ).execute()
+                invalidate_instance(project, zone, node_name)
                 logger.info(
                     "Detached NAT access config",
                     extra={"crd_name": crd_name, "node": node_name, "ip": ip, "zone": zone},
                 )
-                ip_detached = True
                 break
 
-        if not ip_detached:
+        if delete_op is None:
             logger.info(
                 "IP not found on node; nothing to detach",
                 extra={"crd_name": crd_name, "node": node_name, "ip": ip, "zone": zone},
             )
-            return
-        new_node = find_healthy_node(v1_client, node_selector, exclude_node=node_name)
+            return True
+        if not reattach:
+            # The caller attaches the IP elsewhere, which only succeeds once the delete is done
+            wait_for_zone_operation(service, project, zone, delete_op)
+            return True
+        # Pick the replacement while the delete runs; only block on it before reusing the IP
+        new_node = find_healthy_node(v1_client, node_selector, exclude_node=node_name, ip=ip)
         if new_node:
-            attach_ip_to_node(ip, new_node.metadata.name, creds=creds, project=project, crd_name=crd_name)
+            wait_for_zone_operation(service, project, zone, delete_op)
+            attach_ip_to_node(ip, new_node, creds=creds, project=project, crd_name=crd_name)
             logger.info(
                 "Re-attached IP to healthy node",
                 extra={"crd_name": crd_name, "ip": ip, "old_node": node_name, "new_node": new_node.metadata.name},
@@ -331,50 +627,48 @@ def detach_ip_from_node(ip, node_name, v1_client, creds=None, project=None, crd_
                 "No healthy node found to re-attach IP",
                 extra={"crd_name": crd_name, "ip": ip},
             )
+        return True
 
-    except HttpError:
-        tb = traceback.format_exc()
+    except HttpError as e:
+        invalidate_instance(project, zone, node_name)
+        # Re-raised to the reconciler, which logs the traceback once
         logger.error(
-            "GCP API error detaching IP",
-            extra={"crd_name": crd_name, "node": node_name, "ip": ip, "zone": zone, "trace": tb},
+            f"GCP API error detaching IP: HTTP {e.resp.status}",
+            extra={"crd_name": crd_name, "node": node_name, "ip": ip, "zone": zone},
         )
         raise
     except Exception:
-        tb = traceback.format_exc()
-        logger.error(
+        logger.exception(
             "Unexpected error in detach_ip_from_node",
-            extra={"crd_name": crd_name, "node": node_name, "ip": ip, "zone": zone, "trace": tb},
+            extra={"crd_name": crd_name, "node": node_name, "ip": ip, "zone": zone},
         )
         raise
 
 
-def find_healthy_node(v1_client, node_selector=None, exclude_node=None):
-    """Find a healthy node matching the selector."""
-    try:
-        nodes = v1_client.list_node()
-
-        for node in nodes.items:
-            node_name = node.metadata.name
-            if exclude_node and node_name == exclude_node:
-                continue
-
-            if is_node_cordoned(node):
-                continue
-            node_ready = False
-            for condition in node.status.conditions or []:
-                if condition.type == "Ready" and condition.status == "True":
-                    node_ready = True
-                    break
-            if not node_ready:
-                continue
-            if node_selector:
-                node_labels = node.metadata.labels or {}
-                if not all(node_labels.get(k) == v for k, v in node_selector.items()):
-                    continue
-            return node
+def _node_ready(node):
+    ready = next((c for c in node.status.conditions or () if c.type == "Ready"), None)
+    return ready is not None and ready.status == "True"
 
-        return None
+
+def find_healthy_node(v1_client, node_selector=None, exclude_node=None, ip=None):
+    """Find a healthy node matching the selector.
+
+    With ip, the choice is a rendezvous hash of (ip, node) so each IP has a stable preferred node
+    and different IPs spread across the pool; without it, a random healthy node is returned.
+    """
+    try:
+        # Informer-backed and filtered by the cached selector predicate; no LIST per detach.
+        # Cordoned nodes are dropped there too; Ready has no field selector so it is checked here.
+        nodes = list_nodes(v1_client, node_selector or {}, schedulable_only=True)
+        candidates = [
+            node for node in nodes
+            if node.metadata.name != exclude_node and _node_ready(node)
+        ]
+        if not candidates:
+            return None
+        if ip is None:
+            return random.choice(candidates)
+        return min(candidates, key=lambda node: zlib.crc32(f"{ip}/{node.metadata.name}".encode()))
     except Exception:
-        tb = traceback.format_exc()
-        logger.error("Error finding healthy node", extra={"trace": tb})
+        logger.exception("Error finding healthy node")
         return None
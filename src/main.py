@@ -5,12 +5,15 @@ import random
 import logging
 import threading
 import signal
+import socket
 import sys
+import orjson
 from datetime import datetime, timezone, timedelta
 from kubernetes import client, config
 from kubernetes.client.rest import ApiException
 from utils.health_server import start_health_server, controller_state
-from utils.reconciler import reconcile_all
+from utils.reconciler import reconcile_all, wake_reconciler, MAX_CONCURRENT_RECONCILES
+from utils.informer import start_node_informer, start_pod_informer, start_replicaset_informer, get_pod
 from utils.metrics import (
     start_metrics_server, set_controller_info,
     controller_is_leader, controller_healthy, controller_ready
@@ -19,34 +22,70 @@ from utils.metrics import (
 # ---------------- Logging Setup ----------------
 
 class SafeFormatter(logging.Formatter):
+    """Render the logfmt line straight from the record, defaulting missing context keys to ""."""
     def format(self, record):
-        for key in ["crd_name", "node", "ip", "zone", "trace", "leader"]:
-            if not hasattr(record, key):
-                setattr(record, key, "")
-        return super().format(record)
+        get = record.__dict__.get
+        line = (
+            f'ts={self.formatTime(record)} level={record.levelname} msg="{record.getMessage()}" '
+            f'crd={get("crd_name", "")} node={get("node", "")} ip={get("ip", "")} '
+            f'zone={get("zone", "")} trace={get("trace", "")} leader={get("leader", "")}'
+        )
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line = f"{line}\n{record.exc_text}"
+        return line
+
+class JsonFormatter(logging.Formatter):
+    """Render one JSON object per line with orjson, which also escapes quotes and newlines in messages."""
+    def format(self, record):
+        get = record.__dict__.get
+        doc = {"ts": self.formatTime(record), "level": record.levelname, "msg": record.getMessage()}
+        for key, field in _LOG_FIELDS:
+            doc[key] = get(field, "")
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            doc["exc"] = record.exc_text
+        return orjson.dumps(doc, default=str).decode()
+
+# (output key, record attribute) for the context fields of every line
+_LOG_FIELDS = (("crd", "crd_name"), ("node", "node"), ("ip", "ip"), ("zone", "zone"), ("trace", "trace"), ("leader", "leader"))
+_CONTEXT_KEYS = tuple(field for _, field in _LOG_FIELDS)
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "logfmt")
 
 base_logger = logging.getLogger("ip-address-controller")
 base_logger.setLevel(logging.INFO)
 handler = logging.StreamHandler()
-formatter = SafeFormatter(
-    'ts=%(asctime)s level=%(levelname)s msg="%(message)s" crd=%(crd_name)s '
-    'node=%(node)s ip=%(ip)s zone=%(zone)s trace=%(trace)s leader=%(leader)s'
-)
+formatter = JsonFormatter() if LOG_FORMAT == "json" else SafeFormatter()
 handler.setFormatter(formatter)
 base_logger.addHandler(handler)
 
 class ContextLoggerAdapter(logging.LoggerAdapter):
+    """Adapter whose context is per-thread, so concurrent reconciles don't overwrite each other's fields."""
     def __init__(self, logger, identity):
         super().__init__(logger, {})
-        self.context = {"crd_name": "", "node": "", "ip": "", "zone": "", "trace": "", "leader": identity}
+        self.identity = identity
+        self._local = threading.local()
+    @property
+    def context(self):
+        ctx = getattr(self._local, "context", None)
+        if ctx is None:
+            ctx = self._local.context = {"crd_name": "", "node": "", "ip": "", "zone": "", "trace": "", "leader": self.identity}
+        return ctx
     def set_context(self, **kwargs):
         self.context.update(kwargs)
     def process(self, msg, kwargs):
-        extra = kwargs.get("extra", {})
-        combined = {**self.context, **extra}
-        for k in ["crd_name", "node", "ip", "zone", "trace", "leader"]:
-            combined.setdefault(k, "")
-        kwargs["extra"] = combined
+        # LoggerAdapter.log only calls this for enabled levels; SafeFormatter defaults absent keys
+        ctx = self.context
+        extra = kwargs.get("extra")
+        if not extra:
+            kwargs["extra"] = ctx
+            return msg, kwargs
+        for k in _CONTEXT_KEYS:
+            if k not in extra:
+                extra[k] = ctx[k]
         return msg, kwargs
 
 # ---------------- K8s Config ----------------
@@ -54,38 +93,75 @@ _temp_logger = logging.getLogger("ip-address-controller")
 _temp_logger.setLevel(logging.INFO)
 _temp_logger.addHandler(handler)
 
-try:
-    config.load_incluster_config()
-    _temp_logger.info("Using in-cluster config")
-except config.ConfigException:
-    config.load_kube_config()
-    _temp_logger.info("Using local kubeconfig")
+K8S_POOL_MAXSIZE = int(os.getenv("K8S_POOL_MAXSIZE", "32"))
 
+# Populated by bootstrap() so importing this module has no side effects
+v1 = None
+apps_v1 = None
+crd_api = None
+coordination_v1 = None
+# Same APIs on an ApiClient without gzip, for the informers' list+watch
+watch_v1 = None
+watch_apps_v1 = None
 
-v1 = client.CoreV1Api()
-apps_v1 = client.AppsV1Api()
-crd_api = client.CustomObjectsApi()
-coordination_v1 = client.CoordinationV1Api()
+def _init_clients():
+    global v1, apps_v1, crd_api, coordination_v1, watch_v1, watch_apps_v1
+    try:
+        config.load_incluster_config()
+        _temp_logger.info("Using in-cluster config")
+    except config.ConfigException:
+        config.load_kube_config()
+        _temp_logger.info("Using local kubeconfig")
+
+    # One ApiClient (and urllib3 pool) shared by every API wrapper; the default pool keeps only 4 connections
+    cfg = client.Configuration.get_default_copy()
+    # Never smaller than the reconcile workers can use at once, so none of them waits on a connection
+    cfg.connection_pool_maxsize = max(K8S_POOL_MAXSIZE, MAX_CONCURRENT_RECONCILES * 2)
+    api_client = client.ApiClient(configuration=cfg)
+    # urllib3 inflates buffered responses itself, so plain request/response calls can take gzip
+    api_client.set_default_header("Accept-Encoding", "gzip")
+    # kubernetes.watch reads the raw stream (decode_content=False), so watches must stay uncompressed.
+    # Their own pool also keeps long-lived watch connections from holding slots the workers need.
+    watch_client = client.ApiClient(configuration=cfg)
+
+    v1 = client.CoreV1Api(api_client)
+    apps_v1 = client.AppsV1Api(api_client)
+    coordination_v1 = client.CoordinationV1Api(api_client)
+    # Only used for the NetIPAllocation informer
+    crd_api = client.CustomObjectsApi(watch_client)
+    watch_v1 = client.CoreV1Api(watch_client)
+    watch_apps_v1 = client.AppsV1Api(watch_client)
 
 # ---------------- Metadata / Identity ----------------
 
 def get_own_pod_name_from_k8s():
+    """Resolve this pod's name: Downward API env, then hostname, then a pod IP lookup."""
+    pod_name = os.getenv("POD_NAME")
+    if pod_name:
+        return pod_name
+
+    hostname = socket.gethostname()
     try:
-        with open("/var/run/secrets/kubernetes.io/serviceaccount/namespace") as f:
-            namespace = f.read().strip()
-        pod_ip = os.popen("hostname -i").read().strip().split()[0]
-        pods = v1.list_namespaced_pod(namespace)
-        for pod in pods.items:
-            if pod.status.pod_ip == pod_ip:
-                return pod.metadata.name
+        namespace = _read_namespace()
+        try:
+            return get_pod(v1, namespace, hostname).metadata.name
+        except ApiException as e:
+            if e.status != 404:
+                raise
+        # spec.hostname overrides the pod name; find ourselves by IP, filtered server-side
+        pod_ip = os.getenv("POD_IP") or socket.gethostbyname(hostname)
+        pods = v1.list_namespaced_pod(namespace, field_selector=f"status.podIP={pod_ip}", limit=1)
+        if pods.items:
+            return pods.items[0].metadata.name
     except Exception as e:
         _temp_logger.warning(f"Failed to detect pod name via Kubernetes API: {e}")
-    return os.uname()[1]
+    return hostname
 
-POD_NAME = get_own_pod_name_from_k8s()
-IDENTITY = POD_NAME
-logger = ContextLoggerAdapter(base_logger, IDENTITY)
-logger.info(f"Pod started with identity {IDENTITY}")
+POD_NAME = None
+IDENTITY = None
+# This pod's children of the controller status gauges, bound once POD_NAME is known
+_leader_gauge = _healthy_gauge = _ready_gauge = None
+logger = ContextLoggerAdapter(base_logger, "")
 
 # ---------------- Constants ----------------
 
@@ -95,31 +171,16 @@ SKEW_GRACE = int(os.getenv("LEASE_SKEW_GRACE_SEC", "2"))
 RENEW_EVERY = max(1, LEASE_DURATION // 3)
 CONTROLLER_VERSION = os.getenv("CONTROLLER_VERSION", "1.0.0")
 METRICS_PORT = int(os.getenv("METRICS_PORT", "9999"))
+INFORMER_SYNC_TIMEOUT = int(os.getenv("INFORMER_SYNC_TIMEOUT", "60"))
 
-try:
-    with open("/var/run/secrets/kubernetes.io/serviceaccount/namespace") as f:
-        NAMESPACE = f.read().strip()
-except Exception:
-    NAMESPACE = "default"
-
-controller_state.update({
-    "healthy": True,
-    "ready": False,
-    "last_reconcile_ok": None,
-    "leader": False,
-    "bootstrapped": False,
-    "lease_loop_last_tick": None,
-    "lease_duration_seconds": LEASE_DURATION,
-})
+NAMESPACE = "default"
 
-# ---------------- Health Server ----------------
-
-start_health_server(port=8080, logger=logger)
-
-# ---------------- Metrics Server ----------------
-
-start_metrics_server(port=METRICS_PORT, logger=logger)
-set_controller_info(version=CONTROLLER_VERSION, pod_name=POD_NAME)
+def _read_namespace():
+    try:
+        with open("/var/run/secrets/kubernetes.io/serviceaccount/namespace") as f:
+            return f.read().strip()
+    except Exception:
+        return "default"
 
 # ---------------- Helper Functions ----------------
 
@@ -131,7 +192,18 @@ def _now(): return datetime.now(timezone.utc)
 
 def _parse_rfc3339(val):
     if not val: return None
+    # The client usually deserializes renew_time already
+    if isinstance(val, datetime):
+        return val if val.tzinfo else val.replace(tzinfo=timezone.utc)
     s = str(val).strip().replace("Z", "+00:00")
+    try:
+        # C parser; handles RFC3339 with 0-6 fractional digits on Python 3.11+
+        parsed = datetime.fromisoformat(s)
+        if parsed.tzinfo is not None:
+            return parsed
+    except ValueError:
+        pass
+    # Regex path only for what fromisoformat rejects, e.g. more than 6 fractional digits
     m = RFC3339_RE.match(s)
     if not m: return None
     prefix, fraction, tz = m.group("prefix"), m.group("fraction") or "", m.group("tz")
@@ -159,24 +231,32 @@ def _lease_expired(renewed_at, duration):
 
 def _pod_exists(pod_name):
     try:
-        v1.read_namespaced_pod(pod_name, NAMESPACE)
+        # Served from the pod informer while the holder is alive; only a cache miss reaches the API
+        get_pod(v1, NAMESPACE, pod_name)
         return True
     except ApiException as e:
         return e.status != 404
 
+# Last controller-leader value written to our pod; None until the first successful patch
+_last_leader_annotation = None
+
 def _annotate_leader(is_leader: bool):
+    global _last_leader_annotation
+    if _last_leader_annotation == is_leader:
+        return
     try:
         body = {"metadata": {"annotations": {"controller-leader": "true" if is_leader else None}}}
         v1.patch_namespaced_pod(POD_NAME, NAMESPACE, body)
+        _last_leader_annotation = is_leader
         logger.info(f"Updated pod annotation: controller-leader={is_leader}")
     except Exception as e:
         logger.warning(f"Failed to patch leader annotation: {e}")
 
 def _update_controller_metrics():
     """Update controller status metrics."""
-    controller_is_leader.labels(pod_name=POD_NAME).set(1 if controller_state.get("leader") else 0)
-    controller_healthy.labels(pod_name=POD_NAME).set(1 if controller_state.get("healthy") else 0)
-    controller_ready.labels(pod_name=POD_NAME).set(1 if controller_state.get("ready") else 0)
+    _leader_gauge.set(1 if controller_state.get("leader") else 0)
+    _healthy_gauge.set(1 if controller_state.get("healthy") else 0)
+    _ready_gauge.set(1 if controller_state.get("ready") else 0)
 
 # ---------------- Lease Management ----------------
 
@@ -196,12 +276,22 @@ def _create_lease():
     logger.info("Acquired leadership (created lease)")
     return True
 
-def _renew_lease():
-    lease = coordination_v1.read_namespaced_lease(LEASE_NAME, NAMESPACE)
-    lease.spec.holder_identity = IDENTITY
-    lease.spec.renew_time = _now()
-    coordination_v1.replace_namespaced_lease(LEASE_NAME, NAMESPACE, lease)
-    logger.info("Leader lease renewed")
+def _renew_lease(lease):
+    """Renew a lease we hold, conditional on the resourceVersion we read; False if another pod took it."""
+    for attempt in range(2):
+        if lease.spec.holder_identity != IDENTITY:
+            logger.warning(f"Lease taken over by {lease.spec.holder_identity}; not renewing")
+            return False
+        lease.spec.renew_time = _now()
+        try:
+            # metadata.resource_version from the read makes this a compare-and-swap
+            coordination_v1.replace_namespaced_lease(LEASE_NAME, NAMESPACE, lease)
+            logger.info("Leader lease renewed")
+            return True
+        except ApiException as e:
+            if e.status != 409 or attempt:
+                raise
+            lease = coordination_v1.read_namespaced_lease(LEASE_NAME, NAMESPACE)
 
 def _try_takeover(lease):
     now = _now()
@@ -235,7 +325,7 @@ def evaluate_leadership():
     controller_state["bootstrapped"] = True
 
     if holder == IDENTITY and not expired:
-        return True
+        return _renew_lease(lease)
     if holder and holder != IDENTITY and _pod_exists(holder) and not expired:
         return False
     return _try_takeover(lease)
@@ -252,71 +342,114 @@ def shutdown_handler(signum, frame):
         _update_controller_metrics()
     sys.exit(0)
 
-signal.signal(signal.SIGTERM, shutdown_handler)
-signal.signal(signal.SIGINT, shutdown_handler)
-
 # ---------------- Loops ----------------
 
+# Set while this pod holds the lease; controller_loop blocks on it instead of polling
+leader_event = threading.Event()
+
+def _set_leader(is_leader: bool):
+    controller_state["leader"] = is_leader
+    if is_leader:
+        leader_event.set()
+    elif leader_event.is_set():
+        leader_event.clear()
+        wake_reconciler()
+
 def lease_renewal_loop():
     while True:
+        # Deadline set before the work so slow API calls shorten the sleep instead of stretching the period
+        deadline = time.monotonic() + RENEW_EVERY * random.uniform(0.8, 1.2)
         try:
             controller_state["lease_loop_last_tick"] = _now()
             is_leader = evaluate_leadership()
-            controller_state["leader"] = is_leader
+            _set_leader(is_leader)
             _annotate_leader(is_leader)
             # Update leader metric immediately after election
-            controller_is_leader.labels(pod_name=POD_NAME).set(1 if is_leader else 0)
-
-            if is_leader:
-                try:
-                    _renew_lease()
-                except Exception as e:
-                    logger.error(f"Failed to renew lease: {e}")
-                    controller_state["leader"] = False
-                    _annotate_leader(False)
-                    controller_is_leader.labels(pod_name=POD_NAME).set(0)
-
-            time.sleep(RENEW_EVERY * random.uniform(0.8, 1.2))
-        except Exception as e:
-            controller_state["leader"] = False
+            _leader_gauge.set(1 if is_leader else 0)
+        except Exception:
+            _set_leader(False)
             _annotate_leader(False)
-            controller_is_leader.labels(pod_name=POD_NAME).set(0)
-            logger.error(f"Lease renewal error: {e}")
-            time.sleep(RENEW_EVERY)
+            _leader_gauge.set(0)
+            logger.exception("Lease renewal error")
+        time.sleep(max(0.0, deadline - time.monotonic()))
 
 
-# Initialize metrics with default values (so all pods report metrics)
-controller_is_leader.labels(pod_name=POD_NAME).set(0)
-controller_healthy.labels(pod_name=POD_NAME).set(1)
-controller_ready.labels(pod_name=POD_NAME).set(0)
-
 def controller_loop():
     while True:
         try:
-            if controller_state["leader"]:
+            if leader_event.is_set():
                 logger.info("This instance is leader, starting reconciliation loop")
-                reconcile_all(v1, apps_v1, crd_api, logger, POD_NAME)
+                # Returns once the lease loop clears leader_event
+                reconcile_all(v1, apps_v1, crd_api, logger, POD_NAME, is_leader=leader_event.is_set)
             else:
                 # Non-leader: still healthy and ready (standby)
                 controller_state["ready"] = True  # Ready to take over
                 controller_state["healthy"] = True
-                controller_is_leader.labels(pod_name=POD_NAME).set(0)
-                controller_healthy.labels(pod_name=POD_NAME).set(1)
-                controller_ready.labels(pod_name=POD_NAME).set(1)  # Ready as standby
+                _leader_gauge.set(0)
+                _healthy_gauge.set(1)
+                _ready_gauge.set(1)  # Ready as standby
                 logger.info("Not leader, standing by")
-
-            time.sleep(5)
-        except Exception as e:
+                leader_event.wait()
+        except Exception:
             controller_state["ready"] = False
             controller_state["healthy"] = False
-            controller_is_leader.labels(pod_name=POD_NAME).set(0)
-            controller_healthy.labels(pod_name=POD_NAME).set(0)
-            controller_ready.labels(pod_name=POD_NAME).set(0)
-            logger.error(f"Controller main loop error: {e}")
+            _leader_gauge.set(0)
+            _healthy_gauge.set(0)
+            _ready_gauge.set(0)
+            logger.exception("Controller main loop error")
             time.sleep(5)
 
+# ---------------- Bootstrap ----------------
+
+def bootstrap():
+    """Load cluster config, resolve identity and start the health/metrics servers."""
+    global POD_NAME, IDENTITY, NAMESPACE, logger, _leader_gauge, _healthy_gauge, _ready_gauge
+    _init_clients()
+    informers = (
+        start_node_informer(watch_v1), start_pod_informer(watch_v1), start_replicaset_informer(watch_apps_v1)
+    )
+
+    POD_NAME = get_own_pod_name_from_k8s()
+    IDENTITY = POD_NAME
+    _leader_gauge = controller_is_leader.labels(pod_name=POD_NAME)
+    _healthy_gauge = controller_healthy.labels(pod_name=POD_NAME)
+    _ready_gauge = controller_ready.labels(pod_name=POD_NAME)
+    logger = ContextLoggerAdapter(base_logger, IDENTITY)
+    logger.info(f"Pod started with identity {IDENTITY}")
+
+    NAMESPACE = _read_namespace()
+
+    controller_state.update({
+        "healthy": True,
+        "ready": False,
+        "last_reconcile_ok": None,
+        "leader": False,
+        "bootstrapped": False,
+        "lease_loop_last_tick": None,
+        "lease_duration_seconds": LEASE_DURATION,
+    })
+
+    start_health_server(port=8080, logger=logger)
+    start_metrics_server(port=METRICS_PORT, logger=logger)
+    set_controller_info(version=CONTROLLER_VERSION, pod_name=POD_NAME)
+
+    # Reconciles read nodes and pods from these caches; until they sync every read goes to the API
+    deadline = time.monotonic() + INFORMER_SYNC_TIMEOUT
+    for inf in informers:
+        if not inf.wait_for_sync(max(0.0, deadline - time.monotonic())):
+            logger.warning(f"Informer {inf.name} not synced after {INFORMER_SYNC_TIMEOUT}s; reading from the API until it is")
+
+    signal.signal(signal.SIGTERM, shutdown_handler)
+    signal.signal(signal.SIGINT, shutdown_handler)
+
+    # Initialize metrics with default values (so all pods report metrics)
+    _leader_gauge.set(0)
+    _healthy_gauge.set(1)
+    _ready_gauge.set(0)
+
 # ---------------- Entry Point ----------------
 
 if __name__ == "__main__":
+    bootstrap()
     threading.Thread(target=lease_renewal_loop, daemon=True).start()
     controller_loop()
@@ -3,6 +3,7 @@ from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from datetime import datetime, timezone, timedelta
 import threading
 
+# Flag fields (healthy, leader, ready, bootstrapped) must be written as real bools.
 controller_state = {
     "healthy": False,
     "leader": False,
@@ -14,57 +15,70 @@ controller_state = {
     "started_at": datetime.now(timezone.utc),
 }
 
-_state_lock = threading.Lock()
+# (lease_duration_seconds, threshold_seconds, threshold_timedelta), recomputed only when the lease changes
+_readiness_threshold = (None, None, None)
 
 def _now(): return datetime.now(timezone.utc)
 
+def _threshold_for(lease_sec):
+    global _readiness_threshold
+    cached = _readiness_threshold
+    if cached[0] != lease_sec:
+        seconds = max(5, lease_sec) * 2
+        cached = _readiness_threshold = (lease_sec, seconds, timedelta(seconds=seconds))
+    return cached[1], cached[2]
+
 def _as_bool(v):
-    if isinstance(v, bool): return v
-    if v is None: return False
-    return str(v).strip().lower() in ("1", "true", "yes", "y", "on")
+    return bool(v) if v is not None else False
 
 def _evaluate_readiness(now: datetime):
-    with _state_lock:
-        healthy = _as_bool(controller_state.get("healthy"))
-        bootstrapped = _as_bool(controller_state.get("bootstrapped"))
-        last_tick = controller_state.get("lease_loop_last_tick")
-        lease_sec = controller_state.get("lease_duration_seconds") or 15
+    # dict() copies in one C call under the GIL, giving a consistent snapshot without a lock
+    state = dict(controller_state)
+    healthy = _as_bool(state.get("healthy"))
+    bootstrapped = _as_bool(state.get("bootstrapped"))
+    last_tick = state.get("lease_loop_last_tick")
+    lease_sec = state.get("lease_duration_seconds") or 15
 
     if not healthy: return False, "unhealthy=false"
     if not bootstrapped: return False, "not-bootstrapped"
     if not isinstance(last_tick, datetime): return False, "election-loop-no-heartbeat"
 
-    threshold = max(5, lease_sec) * 2
-    if (now - last_tick) > timedelta(seconds=threshold):
+    threshold, threshold_td = _threshold_for(lease_sec)
+    if (now - last_tick) > threshold_td:
         return False, f"election-loop-stalled>{threshold}s"
 
     return True, "ok"
 
+def _response(status, msg):
+    """Build a complete HTTP response (status line, headers and body) as one bytes object."""
+    body = msg.encode()
+    head = (
+        f"HTTP/1.0 {status}\r\n"
+        "Content-Type: text/plain; charset=utf-8\r\n"
+        "Cache-Control: no-store\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "\r\n"
+    )
+    return head.encode() + body
+
+_HEALTHZ_OK = _response("200 OK", "ok")
+_HEALTHZ_FAIL = _response("503 Service Unavailable", "unhealthy")
+_READYZ_OK = _response("200 OK", "ready")
+
 class _Handler(BaseHTTPRequestHandler):
+    # Each probe gets its own thread, so a stalled client only holds its own; this bounds how long
+    timeout = 5
+
     def do_GET(self):
         if self.path == "/healthz":
-            self._ok("ok") if _as_bool(controller_state.get("healthy")) else self._fail("unhealthy")
+            self.wfile.write(_HEALTHZ_OK if _as_bool(controller_state.get("healthy")) else _HEALTHZ_FAIL)
             return
         if self.path == "/readyz":
             ready, reason = _evaluate_readiness(_now())
-            self._ok("ready") if ready else self._fail(f"not-ready: {reason}")
+            self.wfile.write(_READYZ_OK if ready else _response("503 Service Unavailable", f"not-ready: {reason}"))
             return
         self.send_error(404, "not found")
 
-    def _ok(self, msg):
-        self.send_response(200)
-        self.send_header("Content-Type", "text/plain; charset=utf-8")
-        self.send_header("Cache-Control", "no-store")
-        self.end_headers()
-        self.wfile.write(msg.encode())
-
-    def _fail(self, msg):
-        self.send_response(503)
-        self.send_header("Content-Type", "text/plain; charset=utf-8")
-        self.send_header("Cache-Control", "no-store")
-        self.end_headers()
-        self.wfile.write(msg.encode())
-
     def log_message(self, *args): return
 
 def start_health_server(port: int = 8080, logger=None):
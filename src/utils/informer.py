@@ -0,0 +1,293 @@
+import os
+import time
+import logging
+import threading
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+
+logger = logging.getLogger("ip-address-controller")
+
+WATCH_TIMEOUT_SECONDS = int(os.getenv("WATCH_TIMEOUT_SECONDS", "300"))
+INFORMER_RESYNC_SECONDS = int(os.getenv("INFORMER_RESYNC_SECONDS", "600"))
+# Bounds the direct pod LISTs made before the pod informer has synced
+POD_LIST_TIMEOUT = 5
+_FINISHED_PHASES = ("Succeeded", "Failed")
+
+
+def _metadata(obj):
+    """Return (namespace, name, resourceVersion) for typed models and custom-object dicts alike."""
+    if isinstance(obj, dict):
+        meta = obj.get("metadata", {})
+        return meta.get("namespace"), meta.get("name"), meta.get("resourceVersion")
+    meta = obj.metadata
+    return meta.namespace, meta.name, meta.resource_version
+
+
+def _not_older(resource_version, cached_version):
+    """True unless both versions are numeric and the first is older; non-numeric versions are taken as newer."""
+    try:
+        return int(resource_version) >= int(cached_version)
+    except (TypeError, ValueError):
+        return True
+
+
+def _object_key(obj):
+    ns, name, _ = _metadata(obj)
+    return f"{ns}/{name}" if ns else name
+
+
+class Informer:
+    """List+watch a resource in a background thread and serve reads from memory."""
+
+    def __init__(self, name, list_fn, **list_kwargs):
+        self.name = name
+        self._list_fn = list_fn
+        self._list_kwargs = list_kwargs
+        self._objects = {}
+        self._lock = threading.RLock()
+        self._resource_version = None
+        self._last_list = 0.0
+        self._synced = threading.Event()
+        self._handlers = []
+        self._indexers = {}
+        self._indices = {}
+
+    def add_handler(self, fn):
+        """Call fn(event_type, obj) after every watch event, and with "SYNC" for each object on (re)list."""
+        self._handlers.append(fn)
+
+    def add_index(self, name, fn):
+        """Index objects by fn(obj); objects for which fn returns None are left out."""
+        with self._lock:
+            self._indexers[name] = fn
+            self._indices[name] = {}
+            for key, obj in self._objects.items():
+                self._index_add(name, key, obj)
+
+    def by_index(self, name, value):
+        with self._lock:
+            return list(self._indices[name].get(value, {}).values())
+
+    def _index_add(self, name, key, obj):
+        value = self._indexers[name](obj)
+        if value is not None:
+            self._indices[name].setdefault(value, {})[key] = obj
+
+    def _index_remove(self, name, key, obj):
+        value = self._indexers[name](obj)
+        bucket = self._indices[name].get(value)
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self._indices[name][value]
+
+    def _notify(self, event_type, obj):
+        for fn in self._handlers:
+            try:
+                fn(event_type, obj)
+            except Exception:
+                logger.exception(f"Informer {self.name} handler failed")
+
+    def start(self):
+        t = threading.Thread(target=self._run, name=f"{self.name}-informer", daemon=True)
+        t.start()
+        return self
+
+    def has_synced(self):
+        return self._synced.is_set()
+
+    def wait_for_sync(self, timeout=None):
+        return self._synced.wait(timeout)
+
+    def get(self, key):
+        with self._lock:
+            return self._objects.get(key)
+
+    def list(self):
+        with self._lock:
+            return list(self._objects.values())
+
+    def update(self, obj):
+        """Write an object we just received from a write call into the cache ahead of its watch event."""
+        self._apply("MODIFIED", obj)
+
+    def _relist(self):
+        resp = self._list_fn(**self._list_kwargs)
+        if isinstance(resp, dict):
+            items, resource_version = resp.get("items", []), resp.get("metadata", {}).get("resourceVersion")
+        else:
+            items, resource_version = resp.items, resp.metadata.resource_version
+        objects = {_object_key(obj): obj for obj in items}
+        with self._lock:
+            removed = [obj for key, obj in self._objects.items() if key not in objects]
+            self._objects = objects
+            for name in self._indexers:
+                self._indices[name] = {}
+                for key, obj in objects.items():
+                    self._index_add(name, key, obj)
+        self._resource_version = resource_version
+        self._last_list = time.monotonic()
+        self._synced.set()
+        logger.info(f"Informer {self.name} listed {len(objects)} objects")
+
+        for obj in removed:
+            self._notify("DELETED", obj)
+        for obj in objects.values():
+            self._notify("SYNC", obj)
+
+    def _apply(self, event_type, obj):
+        """Apply an event to the cache; returns False if obj is older than the cached copy and was dropped."""
+        key = _object_key(obj)
+        with self._lock:
+            old = self._objects.get(key)
+            # Write-backs from update() and watch events can arrive in either order; never go back in time
+            if event_type != "DELETED" and old is not None and not _not_older(_metadata(obj)[2], _metadata(old)[2]):
+                return False
+            self._objects.pop(key, None)
+            for name in self._indexers:
+                if old is not None:
+                    self._index_remove(name, key, old)
+                if event_type != "DELETED":
+                    self._index_add(name, key, obj)
+            if event_type != "DELETED":
+                self._objects[key] = obj
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                if self._resource_version is None or time.monotonic() - self._last_list > INFORMER_RESYNC_SECONDS:
+                    self._relist()
+
+                w = watch.Watch()
+                for event in w.stream(
+                    self._list_fn,
+                    resource_version=self._resource_version,
+                    timeout_seconds=WATCH_TIMEOUT_SECONDS,
+                    **self._list_kwargs,
+                ):
+                    if event["type"] == "ERROR":
+                        self._resource_version = None
+                        break
+                    obj = event["object"]
+                    applied = self._apply(event["type"], obj)
+                    self._resource_version = _metadata(obj)[2]
+                    if applied:
+                        self._notify(event["type"], obj)
+            except ApiException as e:
+                if e.status == 410:
+                    # Resource version too old; start over with a fresh list
+                    self._resource_version = None
+                    continue
+                logger.exception(f"Informer {self.name} watch failed")
+                self._resource_version = None
+                time.sleep(5)
+            except Exception:
+                logger.exception(f"Informer {self.name} watch failed")
+                self._resource_version = None
+                time.sleep(5)
+
+
+node_informer = None
+pod_informer = None
+replicaset_informer = None
+
+
+def _controller_key(obj):
+    """Index value "<namespace>/<kind>/<name>" of an object's controlling owner, or None."""
+    for ref in obj.metadata.owner_references or ():
+        if ref.controller:
+            return f"{obj.metadata.namespace}/{ref.kind}/{ref.name}"
+    return None
+
+
+def start_node_informer(v1_client):
+    """Start the shared node informer used in place of per-call read_node/list_node."""
+    global node_informer
+    node_informer = Informer("node", v1_client.list_node).start()
+    return node_informer
+
+
+def start_pod_informer(v1_client):
+    """Start the shared pod informer, indexed by the node each pod is scheduled on."""
+    global pod_informer
+    pod_informer = Informer("pod", v1_client.list_pod_for_all_namespaces)
+    pod_informer.add_index("node", lambda pod: pod.spec.node_name)
+    pod_informer.add_index("owner", _controller_key)
+    return pod_informer.start()
+
+
+def start_replicaset_informer(apps_v1_client):
+    """Start the shared ReplicaSet informer, indexed by owning Deployment, to resolve Deployment pods."""
+    global replicaset_informer
+    replicaset_informer = Informer("replicaset", apps_v1_client.list_replica_set_for_all_namespaces)
+    replicaset_informer.add_index("owner", _controller_key)
+    return replicaset_informer.start()
+
+
+def workload_pods(namespace, kind, name):
+    """Return the pods controlled by a workload from the owner indices, or None if they have not synced.
+
+    Deployments resolve through their ReplicaSets, so pods are matched by real ownership, not by name.
+    """
+    if pod_informer is None or not pod_informer.has_synced():
+        return None
+    if kind == "Deployment":
+        if replicaset_informer is None or not replicaset_informer.has_synced():
+            return None
+        owners = [
+            f"{namespace}/ReplicaSet/{rs.metadata.name}"
+            for rs in replicaset_informer.by_index("owner", f"{namespace}/Deployment/{name}")
+        ]
+    else:
+        owners = [f"{namespace}/{kind}/{name}"]
+    return [pod for owner in owners for pod in pod_informer.by_index("owner", owner)]
+
+
+def pods_on_node(v1_client, node_name, namespace=None, active_only=False):
+    """Return the pods scheduled on a node from the informer index, falling back to the API before it has synced.
+
+    With active_only, Succeeded and Failed pods are left out (server-side on the API fallback).
+    """
+    if pod_informer is not None and pod_informer.has_synced():
+        pods = pod_informer.by_index("node", node_name)
+        if namespace is not None:
+            pods = [p for p in pods if p.metadata.namespace == namespace]
+        if active_only:
+            pods = [p for p in pods if p.status.phase not in _FINISHED_PHASES]
+        return pods
+    field_selector = f"spec.nodeName={node_name}"
+    if active_only:
+        field_selector += "".join(f",status.phase!={phase}" for phase in _FINISHED_PHASES)
+    if namespace is not None:
+        return v1_client.list_namespaced_pod(
+            namespace=namespace, field_selector=field_selector, _request_timeout=POD_LIST_TIMEOUT
+        ).items
+    return v1_client.list_pod_for_all_namespaces(
+        field_selector=field_selector, _request_timeout=POD_LIST_TIMEOUT
+    ).items
+
+
+def get_pod(v1_client, namespace, name):
+    """Return the pod from the informer cache, falling back to the API when it is not cached."""
+    if pod_informer is not None and pod_informer.has_synced():
+        pod = pod_informer.get(f"{namespace}/{name}")
+        if pod is not None:
+            return pod
+    return v1_client.read_namespaced_pod(name, namespace)
+
+
+def get_node(v1_client, node_name):
+    """Return the node from the informer cache, falling back to the API before it has synced."""
+    if node_informer is not None and node_informer.has_synced():
+        node = node_informer.get(node_name)
+        if node is not None:
+            return node
+    return v1_client.read_node(node_name)
+
+
+def cached_nodes():
+    """Return every node from the informer cache, or None if it is not running or not yet synced."""
+    if node_informer is None or not node_informer.has_synced():
+        return None
+    return node_informer.list()
@@ -1,31 +1,75 @@
+import logging
+from functools import lru_cache
+from utils import informer
+from utils.informer import cached_nodes
 
-import traceback
 
-def list_nodes(v1_client, label_selector, logger=None, crd_name=""):
+@lru_cache(maxsize=16)
+def _format_selector(items):
+    return ",".join(f"{k}={v}" for k, v in items)
+
+
+@lru_cache(maxsize=256)
+def _compile_selector(items):
+    """Return a predicate over a label dict for this (sorted) selector, built once per selector."""
+    if not items:
+        return lambda labels: True
+    if len(items) == 1:
+        (key, value), = items
+        return lambda labels: labels.get(key) == value
+    return lambda labels: all(labels.get(k) == v for k, v in items)
+
+
+def list_nodes(v1_client, label_selector, logger=None, crd_name="", schedulable_only=False):
+    """List nodes matching label_selector; schedulable_only drops cordoned nodes (server-side on the API fallback)."""
     try:
-        selector = ",".join([f"{k}={v}" for k,v in label_selector.items()])
-        nodes = v1_client.list_node(label_selector=selector).items
+        items = tuple(sorted(label_selector.items()))
+        nodes = cached_nodes()
+        if nodes is not None:
+            matches = _compile_selector(items)
+            nodes = [
+                n for n in nodes
+                if matches(n.metadata.labels or {}) and not (schedulable_only and n.spec.unschedulable)
+            ]
+        else:
+            kwargs = {"field_selector": "spec.unschedulable=false"} if schedulable_only else {}
+            nodes = v1_client.list_node(label_selector=_format_selector(items), resource_version="0", **kwargs).items
         if logger:
             logger.set_context(crd=crd_name)
-            logger.info("Listed nodes in pool", extra={"nodes": [n.metadata.name for n in nodes]})
+            logger.info(f"Listed {len(nodes)} nodes in pool")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Nodes in pool", extra={"nodes": [n.metadata.name for n in nodes]})
         return nodes
     except Exception:
-        tb = traceback.format_exc()
         if logger:
-            logger.set_context(crd=crd_name, trace=tb)
-            logger.error("Failed to list nodes")
+            logger.set_context(crd=crd_name)
+            logger.exception("Failed to list nodes")
         raise
 
+def _labels_already_set(node_name, labels):
+    """True if the cached node already carries these labels (None meaning absent)."""
+    if informer.node_informer is None or not informer.node_informer.has_synced():
+        return False
+    node = informer.node_informer.get(node_name)
+    if node is None:
+        return False
+    current = node.metadata.labels or {}
+    return all(current.get(k) == v for k, v in labels.items())
+
 def patch_node_label(v1_client, node_name, labels, logger=None, crd_name=""):
+    if _labels_already_set(node_name, labels):
+        return
     try:
         body = {"metadata":{"labels": labels}}
-        v1_client.patch_node(node_name, body)
+        node = v1_client.patch_node(node_name, body, _content_type="application/strategic-merge-patch+json")
+        if informer.node_informer is not None:
+            # Keeps _labels_already_set accurate for repeat patches before the watch catches up
+            informer.node_informer.update(node)
         if logger:
             logger.set_context(crd=crd_name, node=node_name)
             logger.info("Patched node labels", extra={"labels": labels})
     except Exception:
-        tb = traceback.format_exc()
         if logger:
-            logger.set_context(crd=crd_name, node=node_name, trace=tb)
-            logger.error("Failed to patch node labels")
+            logger.set_context(crd=crd_name, node=node_name)
+            logger.exception("Failed to patch node labels")
         raise
@@ -1,7 +1,16 @@
+import os
+import logging
 import time
-import traceback
+import heapq
+import queue
+import random
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from utils.k8s_utils import list_nodes, patch_node_label
-from cloud.gcp import attach_ip_to_node, detach_ip_from_node, node_has_ip
+from utils import informer as informers
+from utils.informer import Informer, pods_on_node
+from utils.workloads import owner_matcher, has_workload_pods_on_node, is_node_schedulable, is_node_drained
+from cloud.gcp import attach_ip_to_node, detach_ip_from_node, node_ips_bulk, get_gcp_credentials
 from utils.metrics import (
     crd_status, crd_reserved_ips_total, crd_attached_ips_total, crd_unattached_ips_total,
     ip_attached, node_ip_ready, node_cordoned,
@@ -14,149 +23,110 @@ CRD_GROUP = "netinfra.darkbrains.com"
 CRD_VERSION = "v1alpha1"
 CRD_PLURAL = "netipallocations"
 RECONCILE_INTERVAL_DEFAULT = 30
+ZONE_LABEL = "topology.kubernetes.io/zone"
+MAX_NODE_WORKERS = int(os.getenv("MAX_NODE_WORKERS", "32"))
+MAX_CONCURRENT_RECONCILES = int(os.getenv("MAX_CONCURRENT_RECONCILES", "4"))
+
+_crd_informer = None
+_node_handler_added = False
+# (event_type, crd_name) pushed by the CRD watch; ("NODE", None) makes every CRD due,
+# ("WAKE", None) only wakes reconcile_all so it can re-check leadership
+_dirty_crds = queue.Queue()
+# Last seen schedulability per node, so only cordon/uncordon transitions trigger reconciles
+_node_schedulable = {}
+
+# Long-lived so each worker thread keeps its cached Compute client between reconciles
+_node_executor = ThreadPoolExecutor(max_workers=MAX_NODE_WORKERS, thread_name_prefix="node-worker")
+# Due CRDs are reconciled concurrently; each CRD owns its IPs and nodes for the pass
+_crd_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_RECONCILES, thread_name_prefix="crd-worker")
+
+
+def _list_ips_on_node(nodes, node_ips, creds, project, crd_name=None):
+    """Fill node_ips with the NAT IP set of every node not already in it, and return it."""
+    missing = [n for n in nodes if n.metadata.name not in node_ips]
+    if missing:
+        node_ips.update(node_ips_bulk(missing, creds=creds, project=project, crd_name=crd_name))
+    return node_ips
+
+
+def _node_zone(node):
+    return (node.metadata.labels or {}).get(ZONE_LABEL, "")
+
+
+def _free_nodes_by_zone(nodes, excluded):
+    """Group schedulable nodes not named in excluded by zone, each zone sorted by node name."""
+    free_by_zone = {}
+    for node in sorted(nodes, key=lambda n: (_node_zone(n), n.metadata.name)):
+        if is_node_schedulable(node) and node.metadata.name not in excluded:
+            free_by_zone.setdefault(_node_zone(node), deque()).append(node)
+    return free_by_zone
+
+
+def _pick_free_node(free_by_zone, zone_counts):
+    """Take the next free node from the zone holding the fewest reserved IPs, or None."""
+    # Exhausted zones are dropped below, so every key here still has a free node
+    zone = min(free_by_zone, key=lambda z: (zone_counts[z], z), default=None)
+    if zone is None:
+        return None
+    zone_counts[zone] += 1
+    free = free_by_zone[zone]
+    node = free.popleft()
+    if not free:
+        del free_by_zone[zone]
+    return node
+
+
+def _flush_labels(v1_client, label_ops, crd_name, logger):
+    """Write each node's final ip.ready value, one PATCH per node in parallel; False if any failed."""
+    def _patch(op):
+        node_name, value = op
+        try:
+            patch_node_label(v1_client, node_name, {"ip.ready": value}, crd_name=crd_name)
+            node_ip_ready.labels(node=node_name, crd_name=crd_name).set(1 if value else 0)
+            return True
+        except Exception:
+            logger.exception("Failed to patch ip.ready label", extra={"node": node_name, "crd_name": crd_name})
+            return False
 
+    return all(list(_node_executor.map(_patch, label_ops.items())))
 
-def safe_extra(**kwargs):
-    if "crd_name" not in kwargs:
-        kwargs["crd_name"] = None
-    if "ip" not in kwargs:
-        kwargs["ip"] = None
-    if "node" not in kwargs:
-        kwargs["node"] = None
-    return kwargs
-
-
-def _is_owned_by_workload(owner, workload_kind, workload_name):
-    """Check if owner reference matches the workload."""
-    if workload_kind == "Deployment":
-        return owner.kind == "ReplicaSet" and workload_name in owner.name
-    elif workload_kind == "StatefulSet":
-        return owner.kind == "StatefulSet" and owner.name == workload_name
-    elif workload_kind == "DaemonSet":
-        return owner.kind == "DaemonSet" and owner.name == workload_name
-    return False
-
-
-def has_workload_pods_on_node(node_name, workload_ref, v1_client, logger):
-    """Check if the referenced workload has pods running on this node."""
-    if not workload_ref:
-        return False
 
+def _evict_workload_pods(node_names, workload_ref, v1_client, logger):
+    """Delete the workload's pods from the given nodes; its pods are resolved once, not listed per node."""
     workload_kind = workload_ref.get("kind")
     workload_name = workload_ref.get("name")
     workload_namespace = workload_ref.get("namespace", "default")
-
-    if not workload_kind or not workload_name:
-        return False
-
-    try:
-        pods = v1_client.list_namespaced_pod(
-            namespace=workload_namespace,
-            field_selector=f"spec.nodeName={node_name}",
-        )
-
-        for pod in pods.items:
-            if pod.status.phase not in ("Running", "Pending"):
-                continue
-            if pod.metadata.deletion_timestamp:
-                continue
-
-            owner_refs = pod.metadata.owner_references or []
-            pod_labels = pod.metadata.labels or {}
-
-            # Check owner references based on workload kind
-            for owner in owner_refs:
-                if _is_owned_by_workload(owner, workload_kind, workload_name):
-                    logger.info(
-                        f"Found running pod {pod.metadata.name} from {workload_kind} {workload_name} on node {node_name}",
-                        extra=safe_extra(
-                            node=node_name,
-                            workload_kind=workload_kind,
-                            workload_name=workload_name,
-                        ),
-                    )
-                    return True
-
-            # Fallback: check labels
-            if pod_labels.get("app") == workload_name or pod_labels.get("app.kubernetes.io/name") == workload_name:
-                logger.info(
-                    f"Found running pod {pod.metadata.name} (label match) from {workload_kind} {workload_name} on node {node_name}",
-                    extra=safe_extra(
-                        node=node_name,
-                        workload_kind=workload_kind,
-                        workload_name=workload_name,
-                    ),
+    if not workload_name or not workload_namespace:
+        return
+
+    pods = informers.workload_pods(workload_namespace, workload_kind, workload_name)
+    to_evict = []
+    if pods is not None:
+        # Owner indices: the workload's pods, resolved through its ReplicaSets
+        wanted = set(node_names)
+        to_evict = [pod for pod in pods if pod.spec.node_name in wanted]
+    else:
+        owned = owner_matcher(workload_kind, workload_name)
+        for node_name in node_names:
+            try:
+                to_evict.extend(
+                    pod for pod in pods_on_node(v1_client, node_name, namespace=workload_namespace)
+                    if any(owned(owner) for owner in pod.metadata.owner_references or ())
                 )
-                return True
-
-        return False
-
-    except Exception:
-        tb = traceback.format_exc()
-        logger.error(
-            "Error checking workload pods on node",
-            extra=safe_extra(
-                node=node_name,
-                workload_kind=workload_kind,
-                workload_name=workload_name,
-                namespace=workload_namespace,
-                trace=tb,
-            ),
-        )
-        return True
-
-
-def node_has_any_reserved_ip(node, reserved_ips, creds=None, crd_name=None):
-    for ip in reserved_ips:
-        if node_has_ip(node, ip, creds=creds, crd_name=crd_name):
-            return True
-    return False
-
-
-def is_node_schedulable(node):
-    return not getattr(node.spec, "unschedulable", False)
-
-
-def is_node_drained(node, v1_client, controller_label="app", logger=None, workload_ref=None):
-    """Check if node is drained (no relevant workload pods running)."""
-    if is_node_schedulable(node):
-        return False
-
-    node_name = node.metadata.name
-    pods = v1_client.list_pod_for_all_namespaces(field_selector=f"spec.nodeName={node_name}").items
-
-    for pod in pods:
-        if pod.metadata.namespace in ("kube-system", "gke-system", "istio-system"):
-            continue
-
-        owner_refs = pod.metadata.owner_references or []
-        is_daemonset = any(ref.kind == "DaemonSet" for ref in owner_refs)
-        if is_daemonset:
-            continue
+            except Exception:
+                logger.exception("Error listing pods on invalid node", extra={"node": node_name})
 
-        if workload_ref:
-            workload_kind = workload_ref.get("kind")
-            workload_name = workload_ref.get("name", "")
-            workload_namespace = workload_ref.get("namespace", "default")
-
-            for ref in owner_refs:
-                if _is_owned_by_workload(ref, workload_kind, workload_name):
-                    if pod.metadata.namespace == workload_namespace:
-                        if pod.status.phase in ("Running", "Pending") and not pod.metadata.deletion_timestamp:
-                            if logger:
-                                logger.info(
-                                    f"Found {workload_kind} pod {pod.metadata.name} on node",
-                                    extra=safe_extra(node=node_name)
-                                )
-                            return False
-        else:
-            labels = pod.metadata.labels or {}
-            if labels.get(controller_label):
-                return False
+    def _evict(pod):
+        try:
+            v1_client.delete_namespaced_pod(pod.metadata.name, pod.metadata.namespace, grace_period_seconds=0)
+            logger.warning(
+                f"Evicted pod {pod.metadata.namespace}/{pod.metadata.name} from invalid node",
+                extra={"node": pod.spec.node_name}
+            )
+        except Exception:
+            logger.exception("Error evicting pods from invalid node", extra={"node": pod.spec.node_name})
 
-    if logger:
-        logger.info("Node drained, safe to detach IP", extra=safe_extra(node=node_name))
-    return True
+    list(_node_executor.map(_evict, to_evict))
 
 
 def get_workload_ref(spec):
@@ -178,12 +148,11 @@ def get_workload_ref(spec):
     return {}
 
 
-def reconcile(crd, v1_client, apps_v1_client, logger):
+def reconcile(crd, v1_client, apps_v1_client, logger, creds=None, project=None):
     name = crd.get('metadata', {}).get('name', '')
     spec = crd.get('spec', {})
     reserved_ips = spec.get('reservedIPs', [])
     node_selector = spec.get('nodeSelector', {})
-    cloud_spec = spec.get('cloud', {})
     workload_ref = get_workload_ref(spec)
 
     logger.set_context(crd_name=name)
@@ -192,16 +161,24 @@ def reconcile(crd, v1_client, apps_v1_client, logger):
     # Record metrics - reserved IPs count
     crd_reserved_ips_total.labels(crd_name=name).set(len(reserved_ips))
 
-    start_time = time.time()
+    start_time = time.monotonic()
     attached_count = 0
     unattached_count = 0
     reconcile_success = True
 
+    try:
+        if creds is None or project is None:
+            creds, project = get_gcp_credentials()
+    except Exception:
+        logger.exception("Failed to get GCP credentials", extra={"crd_name": name})
+        reconcile_total.labels(crd_name=name, status='error').inc()
+        crd_status.labels(crd_name=name).set(0)
+        return False
+
     try:
         nodes = list_nodes(v1_client, node_selector, crd_name=name)
     except Exception:
-        tb = traceback.format_exc()
-        logger.error("Failed to list nodes", extra={"trace": tb, "crd_name": name})
+        logger.exception("Failed to list nodes", extra={"crd_name": name})
         reconcile_total.labels(crd_name=name, status='error').inc()
         crd_status.labels(crd_name=name).set(0)
         return False
@@ -212,160 +189,225 @@ def reconcile(crd, v1_client, apps_v1_client, logger):
         node_cordoned.labels(node=node.metadata.name).set(1 if is_cordoned else 0)
 
     assigned_nodes = {}
+    # One batched instance fetch per reconcile; every IP below is checked against this map
+    node_ips = _list_ips_on_node(nodes, {}, creds, project, crd_name=name)
+    # Nodes whose instance could not be read: they may hold any IP, so they are neither
+    # treated as IP-less nor picked as targets, and unowned IPs wait for the next pass
+    unknown_nodes = {node.metadata.name for node in nodes} - node_ips.keys()
+    if unknown_nodes:
+        logger.warning(
+            f"Could not read external IPs of {len(unknown_nodes)} nodes, skipping them this pass",
+            extra={"nodes": sorted(unknown_nodes)}
+        )
+        reconcile_success = False
+    # Built once per reconcile; every membership test below and in cloud/gcp.py uses it
+    reserved_set = frozenset(reserved_ips)
     # Track nodes that already have a reserved IP (one IP per node rule)
-    nodes_with_reserved_ip = set()
+    nodes_with_reserved_ip = {
+        node_name for node_name, ips in node_ips.items() if not ips.isdisjoint(reserved_set)
+    }
+    # Built once so the choice of node for an unattached IP is stable across reconciles and restarts
+    node_by_name = {node.metadata.name: node for node in nodes}
+    zone_counts = Counter(_node_zone(node_by_name[n]) for n in nodes_with_reserved_ip)
+    free_by_zone = _free_nodes_by_zone(nodes, nodes_with_reserved_ip | unknown_nodes)
+    # Inverted index so each reserved IP resolves to its node with one lookup
+    ip_to_node = {
+        ip: node_name for node_name, ips in node_ips.items() for ip in ips if ip in reserved_set
+    }
+
+    # node -> final ip.ready value ("true" or None), written once per node after all attaches and detaches
+    label_ops = {}
+
+    # A pool node labeled ip.ready but holding none of the reserved IPs has a stale label
     for node in nodes:
-        if node_has_any_reserved_ip(node, reserved_ips, creds=cloud_spec.get("credentials"), crd_name=name):
-            nodes_with_reserved_ip.add(node.metadata.name)
+        node_name = node.metadata.name
+        if (node.metadata.labels or {}).get("ip.ready") != "true" or node_name in nodes_with_reserved_ip:
+            continue
+        if node_name in unknown_nodes:
+            continue
+        logger.warning(
+            "Node has ip.ready label but has none of the reserved IPs, removing label",
+            extra={"node": node_name}
+        )
+        label_ops[node_name] = None
+
+    pending_detaches = []   # (ip, node) to move off cordoned/drained nodes, detached after the loop
+    pending_attaches = []   # (ip, target_node) chosen in the loop below, attached after the detaches
+    logger.info(f"Checking {len(reserved_ips)} reserved IPs against {len(nodes)} nodes")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Nodes in pool: {[n.metadata.name for n in nodes]}")
 
     for ip in reserved_ips:
-        logger.set_context(ip=ip, crd_name=name)
+        # One context update per IP; node is reset so a previous IP's node doesn't leak into this one's lines
+        owner = ip_to_node.get(ip)
+        logger.set_context(ip=ip, node=owner or "")
         logger.info("Processing reserved IP")
-        logger.info(f"DEBUG: Checking {len(nodes)} nodes: {[n.metadata.name for n in nodes]}")
         attached = False
 
-        for node in nodes:
-            node_name = node.metadata.name
-            logger.set_context(node=node_name)
+        if owner is not None:
+            node = node_by_name[owner]
+            node_name = owner
             is_node_cordoned = not is_node_schedulable(node)
+            has_label = (node.metadata.labels or {}).get("ip.ready") == "true"
 
             try:
-                has_ip = node_has_ip(node, ip, creds=cloud_spec.get("credentials"), crd_name=name)
-                has_label = node.metadata.labels.get("ip.ready") == "true"
-
-                if has_ip:
-                    logger.info(
-                        f"DEBUG: Found IP on node, cordoned={is_node_cordoned}",
-                        extra=safe_extra(node=node_name, ip=ip)
-                    )
-                    # Update metrics
-                    ip_attached.labels(crd_name=name, ip=ip, node=node_name).set(1)
-                    node_ip_ready.labels(node=node_name, crd_name=name).set(1 if has_label else 0)
-
-                    node_drained = is_node_drained(node, v1_client, logger=logger, workload_ref=workload_ref)
-
-                    should_detach = False
-                    if node_drained:
+                logger.debug(
+                    f"Found IP on node, cordoned={is_node_cordoned}",
+                    extra={"node": node_name, "ip": ip}
+                )
+                # Update metrics
+                ip_attached.labels(crd_name=name, ip=ip, node=node_name).set(1)
+                node_ip_ready.labels(node=node_name, crd_name=name).set(1 if has_label else 0)
+
+                node_drained = is_node_drained(node, v1_client, logger=logger, workload_ref=workload_ref)
+
+                should_detach = False
+                if node_drained:
+                    should_detach = True
+                    logger.info("Node is drained, will detach IP", extra={"node": node_name, "ip": ip})
+                elif is_node_cordoned:
+                    if not has_workload_pods_on_node(node_name, workload_ref, v1_client, logger):
                         should_detach = True
-                        logger.info("Node is drained, will detach IP", extra=safe_extra(node=node_name, ip=ip))
-                    elif is_node_cordoned:
-                        if not has_workload_pods_on_node(node_name, workload_ref, v1_client, logger):
-                            should_detach = True
-                            logger.info(
-                                "Node is cordoned with no workload pods, will detach IP",
-                                extra=safe_extra(node=node_name, ip=ip)
-                            )
-                        else:
-                            logger.info(
-                                "Node is cordoned but workload pods still running, keeping IP",
-                                extra=safe_extra(node=node_name, ip=ip)
-                            )
-
-                    if should_detach:
-                        try:
-                            detach_ip_from_node(
-                                ip, node_name, v1_client,
-                                creds=cloud_spec.get("credentials"),
-                                crd_name=name,
-                                workload_ref=workload_ref,
-                            )
-                            patch_node_label(v1_client, node_name, {"ip.ready": None}, crd_name=name)
-                            logger.info(
-                                "Detached IP and removed label from node",
-                                extra=safe_extra(node=node_name, ip=ip)
-                            )
-                            # Update tracking
-                            nodes_with_reserved_ip.discard(node_name)
-                            # Update metrics
-                            ip_detach_total.labels(crd_name=name, status='success').inc()
-                            ip_attached.labels(crd_name=name, ip=ip, node=node_name).set(0)
-                            node_ip_ready.labels(node=node_name, crd_name=name).set(0)
-                        except Exception:
-                            tb = traceback.format_exc()
-                            logger.error("Failed to detach IP", extra=safe_extra(node=node_name, ip=ip, trace=tb))
-                            ip_detach_total.labels(crd_name=name, status='error').inc()
-                            gcp_api_errors_total.labels(operation='detach', error_type='api_error').inc()
-                            reconcile_success = False
-                    else:
-                        if not has_label:
-                            patch_node_label(v1_client, node_name, {"ip.ready": "true"}, crd_name=name)
-                            logger.info("Restored missing ip.ready label", extra=safe_extra(node=node_name, ip=ip))
-                            node_ip_ready.labels(node=node_name, crd_name=name).set(1)
-                        assigned_nodes[ip] = node_name
-                        attached = True
-                        attached_count += 1
-                        logger.info("IP already attached to node", extra=safe_extra(node=node_name, ip=ip))
-                        break
-
-                elif has_label:
-                    if not node_has_any_reserved_ip(node, reserved_ips, creds=cloud_spec.get("credentials"), crd_name=name):
-                        logger.warning(
-                            "Node has ip.ready label but has none of the reserved IPs, removing label",
-                            extra=safe_extra(node=node_name, ip=ip)
+                        logger.info(
+                            "Node is cordoned with no workload pods, will detach IP",
+                            extra={"node": node_name, "ip": ip}
                         )
-                        patch_node_label(v1_client, node_name, {"ip.ready": None}, crd_name=name)
-                        node_ip_ready.labels(node=node_name, crd_name=name).set(0)
                     else:
-                        logger.debug(
-                            "Node has different reserved IP, skipping label removal",
-                            extra=safe_extra(node=node_name, ip=ip)
+                        logger.info(
+                            "Node is cordoned but workload pods still running, keeping IP",
+                            extra={"node": node_name, "ip": ip}
                         )
 
+                if should_detach:
+                    # Detached below with the others; a new node is picked only once the detach succeeds
+                    pending_detaches.append((ip, node))
+                    continue
+                else:
+                    if not has_label:
+                        label_ops[node_name] = "true"
+                        logger.info("Restoring missing ip.ready label", extra={"node": node_name, "ip": ip})
+                    assigned_nodes[ip] = node_name
+                    attached = True
+                    attached_count += 1
+                    logger.info("IP already attached to node", extra={"node": node_name, "ip": ip})
+
             except Exception:
-                tb = traceback.format_exc()
-                logger.error("Error checking IP on node", extra=safe_extra(node=node_name, ip=ip, trace=tb))
+                logger.exception("Error checking IP on node", extra={"node": node_name, "ip": ip})
                 gcp_api_errors_total.labels(operation='check_ip', error_type='api_error').inc()
                 reconcile_success = False
+                # Still held by its node; attaching it elsewhere would only fail
+                continue
 
         if not attached:
-            # Only consider nodes that don't already have a reserved IP
-            free_nodes_schedulable = [
-                n for n in nodes
-                if is_node_schedulable(n)
-                and n.metadata.name not in nodes_with_reserved_ip
-            ]
-
-            if not free_nodes_schedulable:
+            if unknown_nodes:
+                logger.info("IP not found on readable nodes; not attaching while some nodes are unknown", extra={"ip": ip})
+                unattached_count += 1
+                continue
+            # Least-loaded zone first; nodes already holding a reserved IP were excluded up front
+            target_node = _pick_free_node(free_by_zone, zone_counts)
+
+            if target_node is None:
                 logger.info(
                     "No free nodes available for IP (all nodes already have a reserved IP or are unschedulable)",
-                    extra=safe_extra(ip=ip)
+                    extra={"ip": ip}
                 )
                 unattached_count += 1
                 ip_attached.labels(crd_name=name, ip=ip, node='none').set(0)
                 continue
 
-            target_node = free_nodes_schedulable[0]
-            try:
-                attach_ip_to_node(
-                    ip, target_node.metadata.name,
-                    creds=cloud_spec.get("credentials"),
-                    crd_name=name
-                )
-                patch_node_label(v1_client, target_node.metadata.name, {"ip.ready": "true"}, crd_name=name)
-                assigned_nodes[ip] = target_node.metadata.name
-                nodes_with_reserved_ip.add(target_node.metadata.name)  # Track this node now has an IP
-                attached_count += 1
-                logger.info(
-                    "IP attached and node labeled ip.ready",
-                    extra=safe_extra(node=target_node.metadata.name, ip=ip)
-                )
-                # Update metrics
-                ip_attach_total.labels(crd_name=name, status='success').inc()
-                ip_attached.labels(crd_name=name, ip=ip, node=target_node.metadata.name).set(1)
-                node_ip_ready.labels(node=target_node.metadata.name, crd_name=name).set(1)
-            except Exception:
-                tb = traceback.format_exc()
-                logger.error(
-                    "GCP API error attaching IP to node",
-                    extra=safe_extra(node=target_node.metadata.name, ip=ip, trace=tb)
-                )
-                ip_attach_total.labels(crd_name=name, status='error').inc()
-                gcp_api_errors_total.labels(operation='attach', error_type='api_error').inc()
+            pending_attaches.append((ip, target_node))
+
+    logger.set_context(ip="", node="")
+
+    # Detaches are per node and independent; run them (and their operation waits) together.
+    # They only detach: each freed IP is placed below by the zone-balanced picker, with the attaches.
+    def _detach(pending):
+        ip, node = pending
+        try:
+            return detach_ip_from_node(
+                ip, node.metadata.name, v1_client,
+                creds=creds, project=project,
+                crd_name=name,
+                workload_ref=workload_ref,
+                node_selector=node_selector,
+                node=node,
+                reattach=False,
+            )
+        except Exception:
+            logger.exception("Failed to detach IP", extra={"crd_name": name, "node": node.metadata.name, "ip": ip})
+            return None
+
+    for (ip, node), detached in zip(pending_detaches, _node_executor.map(_detach, pending_detaches)):
+        node_name = node.metadata.name
+        if detached:
+            label_ops[node_name] = None
+            logger.info("Detached IP from node", extra={"node": node_name, "ip": ip})
+            # Update tracking
+            node_ips[node_name].discard(ip)
+            nodes_with_reserved_ip.discard(node_name)
+            zone_counts[_node_zone(node)] -= 1
+            # Update metrics
+            ip_detach_total.labels(crd_name=name, status='success').inc()
+            ip_attached.labels(crd_name=name, ip=ip, node=node_name).set(0)
+            target_node = _pick_free_node(free_by_zone, zone_counts)
+            if target_node is None:
+                logger.info("No free node to move detached IP to", extra={"ip": ip})
                 unattached_count += 1
-                reconcile_success = False
+                ip_attached.labels(crd_name=name, ip=ip, node='none').set(0)
+            else:
+                pending_attaches.append((ip, target_node))
+            continue
+        if detached is None:
+            ip_detach_total.labels(crd_name=name, status='error').inc()
+            gcp_api_errors_total.labels(operation='detach', error_type='api_error').inc()
+            reconcile_success = False
+        # Detach skipped or failed: the IP stays on its node, which keeps its zone's count
+        assigned_nodes[ip] = node_name
+        attached_count += 1
+
+    # Attaches for different nodes are independent; run them (and their operation waits) together
+    def _attach(pending):
+        ip, target_node = pending
+        try:
+            attach_ip_to_node(
+                ip, target_node,
+                creds=creds, project=project,
+                crd_name=name, wait=True,
+            )
+            return True
+        except Exception:
+            logger.exception(
+                "GCP API error attaching IP to node",
+                extra={"crd_name": name, "node": target_node.metadata.name, "ip": ip}
+            )
+            return False
+
+    for (ip, target_node), ok in zip(pending_attaches, _node_executor.map(_attach, pending_attaches)):
+        target_name = target_node.metadata.name
+        if ok:
+            assigned_nodes[ip] = target_name
+            nodes_with_reserved_ip.add(target_name)  # Track this node now has an IP
+            node_ips.setdefault(target_name, set()).add(ip)
+            label_ops[target_name] = "true"
+            attached_count += 1
+            logger.info(
+                "IP attached to node",
+                extra={"node": target_name, "ip": ip}
+            )
+            # Update metrics
+            ip_attach_total.labels(crd_name=name, status='success').inc()
+            ip_attached.labels(crd_name=name, ip=ip, node=target_name).set(1)
+        else:
+            ip_attach_total.labels(crd_name=name, status='error').inc()
+            gcp_api_errors_total.labels(operation='attach', error_type='api_error').inc()
+            unattached_count += 1
+            reconcile_success = False
+
+    if not _flush_labels(v1_client, label_ops, name, logger):
+        reconcile_success = False
 
     # Record final metrics for this CRD
-    duration = time.time() - start_time
+    duration = time.monotonic() - start_time
     reconcile_duration_seconds.labels(crd_name=name).observe(duration)
     crd_attached_ips_total.labels(crd_name=name).set(attached_count)
     crd_unattached_ips_total.labels(crd_name=name).set(unattached_count)
@@ -381,124 +423,168 @@ def reconcile(crd, v1_client, apps_v1_client, logger):
     logger.info("Checking for incorrectly labeled nodes", extra={"crd_name": name})
 
     try:
-        all_nodes = v1_client.list_node().items
-        for node in all_nodes:
+        # Same selector path as the pool listing: informer cache, or a label-selected watch-cache LIST
+        labeled_nodes = list_nodes(v1_client, {"ip.ready": "true"}, crd_name=name)
+
+        # Labeled nodes outside the selector are the only ones not fetched above
+        _list_ips_on_node(labeled_nodes, node_ips, creds, project, crd_name=name)
+
+        invalid_nodes = []
+        for node in labeled_nodes:
             node_name = node.metadata.name
-            labels = node.metadata.labels or {}
-            if labels.get("ip.ready") != "true":
+            if node_name not in node_ips:
+                # Unknown, not IP-less: leave its label and pods alone this pass
                 continue
-
-            try:
-                has_valid_ip = node_has_any_reserved_ip(
-                    node, reserved_ips,
-                    creds=cloud_spec.get("credentials"),
-                    crd_name=name
-                )
-            except Exception:
-                has_valid_ip = False
-                logger.warning("Could not validate node IPs", extra=safe_extra(node=node_name))
+            has_valid_ip = not node_ips[node_name].isdisjoint(reserved_set)
 
             if not has_valid_ip:
                 logger.warning(
                     "Node is labeled ip.ready but has no valid reserved IP",
-                    extra=safe_extra(node=node_name)
+                    extra={"node": node_name}
                 )
                 try:
                     patch_node_label(v1_client, node_name, {"ip.ready": None}, crd_name=name)
-                    logger.info("Removed ip.ready label from node", extra=safe_extra(node=node_name))
+                    logger.info("Removed ip.ready label from node", extra={"node": node_name})
                     node_ip_ready.labels(node=node_name, crd_name=name).set(0)
                 except Exception:
-                    logger.error("Failed to remove ip.ready label", extra=safe_extra(node=node_name))
+                    logger.error("Failed to remove ip.ready label", extra={"node": node_name})
 
-                try:
-                    if workload_ref:
-                        workload_kind = workload_ref.get("kind")
-                        workload_name = workload_ref.get("name")
-                        workload_namespace = workload_ref.get("namespace", "default")
-
-                        if workload_name and workload_namespace:
-                            pods = v1_client.list_pod_for_all_namespaces(
-                                field_selector=f"spec.nodeName={node_name}"
-                            ).items
-
-                            for pod in pods:
-                                owners = pod.metadata.owner_references or []
-                                for owner in owners:
-                                    if _is_owned_by_workload(owner, workload_kind, workload_name):
-                                        if pod.metadata.namespace == workload_namespace:
-                                            evict_pod_name = pod.metadata.name
-                                            v1_client.delete_namespaced_pod(
-                                                evict_pod_name,
-                                                pod.metadata.namespace,
-                                                grace_period_seconds=0
-                                            )
-                                            logger.warning(
-                                                f"Evicted pod {workload_namespace}/{evict_pod_name} from invalid node",
-                                                extra=safe_extra(node=node_name)
-                                            )
-                except Exception:
-                    tb = traceback.format_exc()
-                    logger.error(
-                        "Error evicting pods from invalid node",
-                        extra=safe_extra(node=node_name, trace=tb)
-                    )
+                invalid_nodes.append(node_name)
+
+        if invalid_nodes and workload_ref:
+            _evict_workload_pods(invalid_nodes, workload_ref, v1_client, logger)
 
     except Exception:
-        tb = traceback.format_exc()
-        logger.error("Failed to cleanup invalid nodes", extra={"trace": tb, "crd_name": name})
+        logger.exception("Failed to cleanup invalid nodes", extra={"crd_name": name})
 
     return reconcile_success
 
 
-def reconcile_all(v1_client, apps_v1_client, crd_api_client, logger, pod_name="unknown"):
-    """
-    Main reconciliation loop. Runs forever, processing all CRDs.
-    """
-    last_reconcile_time = {}
+def _crd_interval(crd):
+    interval = crd.get("spec", {}).get("reconcileInterval", RECONCILE_INTERVAL_DEFAULT)
+    try:
+        return int(interval)
+    except (ValueError, TypeError):
+        return RECONCILE_INTERVAL_DEFAULT
 
-    while True:
-        now = time.time()
-        cycle_success = True
-        try:
-            crds = crd_api_client.list_cluster_custom_object(
-                group=CRD_GROUP,
-                version=CRD_VERSION,
-                plural=CRD_PLURAL
-            ).get("items", [])
 
-            for crd in crds:
-                crd_name = crd.get("metadata", {}).get("name", "")
-                spec = crd.get("spec", {})
-                interval = spec.get("reconcileInterval", RECONCILE_INTERVAL_DEFAULT)
+def _start_crd_informer(crd_api_client):
+    """Watch NetIPAllocations and queue the name of every CRD that changes."""
+    global _crd_informer
+    if _crd_informer is not None:
+        return _crd_informer
 
-                try:
-                    interval = int(interval)
-                except (ValueError, TypeError):
-                    interval = RECONCILE_INTERVAL_DEFAULT
+    def _enqueue(event_type, crd):
+        _dirty_crds.put((event_type, crd.get("metadata", {}).get("name", "")))
 
-                last_ts = last_reconcile_time.get(crd_name, 0)
-                if now - last_ts < interval:
-                    continue
+    _crd_informer = Informer(
+        "netipallocation",
+        crd_api_client.list_cluster_custom_object,
+        group=CRD_GROUP,
+        version=CRD_VERSION,
+        plural=CRD_PLURAL,
+    )
+    _crd_informer.add_handler(_enqueue)
+    return _crd_informer.start()
 
-                last_reconcile_time[crd_name] = now
-                try:
-                    success = reconcile(crd, v1_client, apps_v1_client, logger)
-                    if success is False:
-                        cycle_success = False
-                except Exception:
-                    tb = traceback.format_exc()
-                    logger.error(
-                        f"Failed to reconcile CRD {crd_name}",
-                        extra={"trace": tb, "crd_name": crd_name}
-                    )
-                    cycle_success = False
 
-            controller_ready.labels(pod_name=pod_name).set(1 if cycle_success else 0)
+def _on_node_event(event_type, node):
+    """Queue a reconcile of every CRD when a node is cordoned, uncordoned or removed."""
+    node_name = node.metadata.name
+    if event_type == "DELETED":
+        _node_schedulable.pop(node_name, None)
+        _dirty_crds.put(("NODE", None))
+        return
+    schedulable = is_node_schedulable(node)
+    previous = _node_schedulable.get(node_name)
+    _node_schedulable[node_name] = schedulable
+    if previous is not None and previous != schedulable:
+        _dirty_crds.put(("NODE", None))
+
 
+def wake_reconciler():
+    """Wake a blocked reconcile_all so it re-checks is_leader without waiting for the next due CRD."""
+    _dirty_crds.put(("WAKE", None))
+
+
+def reconcile_all(v1_client, apps_v1_client, crd_api_client, logger, pod_name="unknown", is_leader=lambda: True):
+    """
+    Main reconciliation loop. Runs until is_leader() turns false, processing all CRDs.
+
+    CRDs come from a watch-backed informer instead of a LIST every tick. Each CRD has
+    its own due time in a heap: a watch event makes it due immediately, and after every
+    reconcile it is rescheduled reconcileInterval (plus up to 10% jitter) later.
+    """
+    global _node_handler_added
+    informer = _start_crd_informer(crd_api_client)
+    if informers.node_informer is not None and not _node_handler_added:
+        # React to drains as the node watch reports them; the interval stays as the fallback.
+        # Added once: reconcile_all is re-entered on every leadership term.
+        informers.node_informer.add_handler(_on_node_event)
+        _node_handler_added = True
+    schedule = []   # heap of (due_monotonic, crd_name); entries not matching next_due are stale
+    next_due = {}
+
+    def _schedule(crd_name, due):
+        next_due[crd_name] = due
+        heapq.heappush(schedule, (due, crd_name))
+
+    # Anything already in the cache (a previous leadership term consumed its SYNC events)
+    for crd in informer.list():
+        _schedule(crd.get("metadata", {}).get("name", ""), time.monotonic())
+
+    while is_leader():
+        timeout = max(0.0, schedule[0][0] - time.monotonic()) if schedule else None
+        try:
+            event_type, crd_name = _dirty_crds.get(timeout=timeout)
+            while True:
+                if event_type == "NODE":
+                    for crd in informer.list():
+                        _schedule(crd.get("metadata", {}).get("name", ""), time.monotonic())
+                elif event_type == "DELETED":
+                    next_due.pop(crd_name, None)
+                elif event_type != "WAKE":
+                    _schedule(crd_name, time.monotonic())
+                event_type, crd_name = _dirty_crds.get_nowait()
+        except queue.Empty:
+            pass
+
+        now = time.monotonic()
+        due_names = []
+        while schedule and schedule[0][0] <= now:
+            due, crd_name = heapq.heappop(schedule)
+            if next_due.get(crd_name) == due:
+                del next_due[crd_name]
+                due_names.append(crd_name)
+
+        if not due_names or not is_leader():
+            continue
+
+        def _reconcile_one(crd_name):
+            crd = informer.get(crd_name)
+            if crd is None:
+                return True
+            try:
+                return reconcile(crd, v1_client, apps_v1_client, logger, creds=creds, project=project) is not False
+            except Exception:
+                logger.exception(
+                    f"Failed to reconcile CRD {crd_name}",
+                    extra={"crd_name": crd_name}
+                )
+                return False
+
+        try:
+            # Resolved once per batch and shared by every CRD in it; the authorized
+            # transport refreshes the token itself when it expires
+            creds, project = get_gcp_credentials()
+            results = list(_crd_executor.map(_reconcile_one, due_names))
+            controller_ready.labels(pod_name=pod_name).set(1 if all(results) else 0)
         except Exception:
-            tb = traceback.format_exc()
-            logger.set_context(trace=tb)
-            logger.error("Failed to list CRDs or reconcile")
+            logger.exception("Failed to reconcile CRDs")
             controller_ready.labels(pod_name=pod_name).set(0)
 
-        time.sleep(5)
+        for crd_name in due_names:
+            crd = informer.get(crd_name)
+            if crd is not None and crd_name not in next_due:
+                interval = _crd_interval(crd)
+                _schedule(crd_name, time.monotonic() + interval + random.uniform(0, interval * 0.1))
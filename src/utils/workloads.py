@@ -0,0 +1,133 @@
+from functools import lru_cache
+from utils.informer import pods_on_node, workload_pods
+
+
+@lru_cache(maxsize=64)
+def owner_matcher(workload_kind, workload_name):
+    """Return a predicate owner_ref -> bool for this workload, built once per (kind, name)."""
+    if workload_kind == "Deployment":
+        # Deployment ReplicaSets are named <deployment>-<pod-template-hash>
+        return lambda owner: owner.kind == "ReplicaSet" and owner.name.rpartition("-")[0] == workload_name
+    if workload_kind in ("StatefulSet", "DaemonSet"):
+        return lambda owner: owner.kind == workload_kind and owner.name == workload_name
+    return lambda owner: False
+
+
+def has_workload_pods_on_node(node_name, workload_ref, v1_client, logger):
+    """Check if the referenced workload has pods running on this node."""
+    if not workload_ref:
+        return False
+
+    workload_kind = workload_ref.get("kind")
+    workload_name = workload_ref.get("name")
+    workload_namespace = workload_ref.get("namespace", "default")
+
+    if not workload_kind or not workload_name:
+        return False
+
+    owned = owner_matcher(workload_kind, workload_name)
+    try:
+        # Not pushed down as a label selector: pods are matched by label or by owner reference
+        pods = pods_on_node(v1_client, node_name, namespace=workload_namespace, active_only=True)
+
+        for pod in pods:
+            if pod.status.phase not in ("Running", "Pending"):
+                continue
+            if pod.metadata.deletion_timestamp:
+                continue
+
+            # Label match first: two dict lookups, and it settles most pods without walking owners
+            pod_labels = pod.metadata.labels or {}
+            if pod_labels.get("app") == workload_name or pod_labels.get("app.kubernetes.io/name") == workload_name:
+                logger.info(
+                    f"Found running pod {pod.metadata.name} (label match) from {workload_kind} {workload_name} on node {node_name}",
+                    extra={
+                        "node": node_name,
+                        "workload_kind": workload_kind,
+                        "workload_name": workload_name,
+                    },
+                )
+                return True
+
+            # Fallback: check owner references based on workload kind
+            if any(owned(owner) for owner in pod.metadata.owner_references or ()):
+                logger.info(
+                    f"Found running pod {pod.metadata.name} from {workload_kind} {workload_name} on node {node_name}",
+                    extra={
+                        "node": node_name,
+                        "workload_kind": workload_kind,
+                        "workload_name": workload_name,
+                    },
+                )
+                return True
+
+        return False
+
+    except Exception:
+        logger.exception(
+            "Error checking workload pods on node",
+            extra={
+                "node": node_name,
+                "workload_kind": workload_kind,
+                "workload_name": workload_name,
+                "namespace": workload_namespace,
+            },
+        )
+        return True
+
+
+def is_node_schedulable(node):
+    return not getattr(node.spec, "unschedulable", False)
+
+
+def is_node_drained(node, v1_client, controller_label="app", logger=None, workload_ref=None):
+    """Check if node is drained (no relevant workload pods running)."""
+    if is_node_schedulable(node):
+        return False
+
+    node_name = node.metadata.name
+    pods = None
+
+    if workload_ref:
+        workload_kind = workload_ref.get("kind")
+        workload_namespace = workload_ref.get("namespace", "default")
+        owned = owner_matcher(workload_kind, workload_ref.get("name", ""))
+        # Only the workload's own pods can keep the node from counting as drained
+        pods = workload_pods(workload_namespace, workload_kind, workload_ref.get("name", ""))
+        if pods is not None:
+            pods = [p for p in pods if p.spec.node_name == node_name]
+
+    # Pods from the owner index are the workload's by construction; otherwise check owner refs
+    indexed = pods is not None
+    if not indexed:
+        pods = pods_on_node(v1_client, node_name)
+
+    for pod in pods:
+        if pod.metadata.namespace in ("kube-system", "gke-system", "istio-system"):
+            continue
+
+        owner_refs = pod.metadata.owner_references or []
+        is_daemonset = any(ref.kind == "DaemonSet" for ref in owner_refs)
+        if is_daemonset:
+            continue
+
+        if workload_ref:
+            if pod.metadata.namespace != workload_namespace:
+                continue
+            if pod.status.phase not in ("Running", "Pending") or pod.metadata.deletion_timestamp:
+                continue
+            if indexed or any(owned(ref) for ref in owner_refs):
+                if logger:
+                    logger.info(
+                        f"Found {workload_kind} pod {pod.metadata.name} on node",
+                        extra={"node": node_name}
+                    )
+                return False
+        else:
+            labels = pod.metadata.labels or {}
+            if labels.get(controller_label):
+                return False
+
+    if logger:
+        logger.info("Node drained, safe to detach IP", extra={"node": node_name})
+    return True